@@ -1,31 +1,80 @@
 #!/usr/bin/env python3
 """
 Simplified configuration for Battery Monitor Add-on with Multi-battery support
+
+get_config() returns one cached, read-only snapshot of the options;
+reload_config() parses options.json again and reports what changed, and
+OptionsWatcher triggers that when the file's mtime changes.
 """
 
 import glob
 import json
 import os
+import threading
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+
+
+OPTIONS_PATH = '/data/options.json'
+
+# Serial speeds a battery entry may use (config.yaml only checks the range)
+STANDARD_BAUDRATES = (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200)
+
 
+class _ReadOnly:
+    """Attributes can be set until freeze(); afterwards the object is a snapshot"""
+    _frozen = False
 
-class BatteryConfig:
+    def freeze(self) -> None:
+        object.__setattr__(self, '_frozen', True)
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError(f"{type(self).__name__} is read-only ({name}); use reload_config()")
+        object.__setattr__(self, name, value)
+
+
+class BatteryConfig(_ReadOnly):
     """Configuration for a single battery"""
+
+    # Fields whose change makes a battery "changed" in a reload diff
+    IDENTITY = ('port', 'address', 'baudrate', 'protocol', 'timeout')
+
     def __init__(self, port: str = "/dev/ttyUSB0", address: int = 1, 
-                 name: str = None, enabled: bool = True):
+                 name: str = None, enabled: bool = True,
+                 baudrate: int = 9600, protocol: str = "service42",
+                 timeout: float = 2.0):
         self.port = port
         self.address = address
         self.name = name or f"Battery_{address}"
         self.enabled = enabled
-        self.baudrate = 9600
-        self.timeout = 2.0
+        self.baudrate = baudrate
+        # "service42" (polled) or "modbus" (detected by discovery, not polled yet)
+        self.protocol = protocol
+        self.timeout = timeout
+
+    def identity(self) -> Tuple:
+        return tuple(getattr(self, field) for field in self.IDENTITY)
+
+    def with_name(self, name: str) -> 'BatteryConfig':
+        """Read-only copy under another name"""
+        battery = BatteryConfig(self.port, self.address, name, self.enabled,
+                                self.baudrate, self.protocol, self.timeout)
+        battery.freeze()
+        return battery
+
 
+class Config(_ReadOnly):
+    """Enhanced configuration for Battery Monitor with multi-battery support.
 
-class Config:
-    """Enhanced configuration for Battery Monitor with multi-battery support"""
+    Read-only once loaded; use get_config() / reload_config() instead of
+    constructing it directly.
+    """
     def __init__(self):
         self.load_config()
+        for battery in self.batteries:
+            battery.freeze()
+        self.freeze()
     
     def load_config(self):
         """Load configuration from Home Assistant options or environment"""
@@ -64,6 +113,31 @@ class Config:
         
         # Application Configuration
         self.read_interval = int(options.get('read_interval', os.getenv('READ_INTERVAL', '30')))
+        # Run serial polling and MQTT publishing on a single asyncio event loop
+        self.async_engine = bool(options.get('async_engine', False))
+        # Derive per-battery read timeouts from observed response latency
+        self.adaptive_timeout = bool(options.get('adaptive_timeout', True))
+        # Stop polling persistently failing batteries; probe them with backoff
+        self.circuit_breaker = bool(options.get('circuit_breaker', True))
+        # One JSON state message per device instead of one message per sensor
+        self.mqtt_json_state = bool(options.get('mqtt_json_state', False))
+        # Only republish values that moved past their deadband, plus a periodic heartbeat
+        self.publish_on_change = bool(options.get('publish_on_change', True))
+        self.heartbeat_interval = int(options.get('heartbeat_interval', 300))
+        # Readings buffered while MQTT is unavailable (oldest dropped, or spilled to /data)
+        self.publish_queue_size = int(options.get('publish_queue_size', 120))
+        self.publish_spill = bool(options.get('publish_spill', False))
+        # QoS per topic class and max unacknowledged messages
+        self.mqtt_qos_discovery = int(options.get('mqtt_qos_discovery', 1))
+        self.mqtt_qos_state = int(options.get('mqtt_qos_state', 0))
+        self.mqtt_qos_availability = int(options.get('mqtt_qos_availability', 1))
+        self.mqtt_max_in_flight = int(options.get('mqtt_max_in_flight', 100))
+        # Seconds between writes of the energy counter file (also written on shutdown)
+        self.energy_flush_interval = int(options.get('energy_flush_interval', 60))
+        # Energy counter storage: "json" snapshot or append-only "journal"
+        self.energy_storage = str(options.get('energy_storage', 'json')).lower()
+        # Intervals between energy samples longer than this are not integrated
+        self.energy_max_gap = int(options.get('energy_max_gap', 600))
         # Default to WARNING to reduce log verbosity; allow override via option or env
         self.log_level = str(options.get('log_level', os.getenv('LOG_LEVEL', 'WARNING'))).upper()
 
@@ -72,6 +146,18 @@ class Config:
         self.discovery_address_from = int(options.get('discovery_address_from', 1))
         self.discovery_address_to = int(options.get('discovery_address_to', 16))
         self.discovery_timeout_ms = int(options.get('discovery_timeout_ms', 300))
+        # Stop a port's sweep after this many silent addresses past the last hit (0 = full range)
+        self.discovery_max_misses = int(options.get('discovery_max_misses', 8))
+        # Fingerprinting: baud rates and protocols tried per address, in order
+        self.discovery_baudrates = options.get('discovery_baudrates', [9600, 19200, 115200])
+        self.discovery_protocols = options.get('discovery_protocols', ['service42', 'modbus'])
+        # Reload options.json when it changes and apply battery changes without a restart
+        self.watch_options = bool(options.get('watch_options', False))
+        # Probe unused addresses in idle time while monitoring and attach new packs
+        self.hotplug_scan = bool(options.get('hotplug_scan', False))
+        self.hotplug_interval = int(options.get('hotplug_interval', 300))
+        # Re-verify devices from the discovery inventory, then sweep only unknown addresses
+        self.discovery_incremental = bool(options.get('discovery_incremental', False))
         self.discovery_ports = options.get('discovery_ports', [])
         
         # Configuration diagnostics
@@ -90,8 +176,14 @@ class Config:
             address = bat_config.get('address', i + 1)
             name = bat_config.get('name', f'Battery_{address}')
             enabled = bat_config.get('enabled', True)
+            baudrate = self._battery_baudrate(bat_config.get('baudrate', 9600), name)
+            protocol = str(bat_config.get('protocol', 'service42')).lower()
+            timeout = float(bat_config.get('timeout', 2.0))
+            if protocol != 'service42':
+                # Only Service 42 has a reader; keep the entry but do not poll it
+                enabled = False
             
-            batteries.append(BatteryConfig(port, address, name, enabled))
+            batteries.append(BatteryConfig(port, address, name, enabled, baudrate, protocol, timeout))
         
         return batteries
 
@@ -134,6 +226,21 @@ class Config:
         """Get list of enabled batteries"""
         return [bat for bat in self.batteries if bat.enabled]
     
+    @staticmethod
+    def _battery_baudrate(value, name: str) -> int:
+        """Battery baud rate; non-standard values fall back to 9600"""
+        try:
+            baudrate = int(value)
+        except (TypeError, ValueError):
+            baudrate = None
+        if baudrate not in STANDARD_BAUDRATES:
+            import logging
+            logging.getLogger(__name__).warning(
+                f"⚠️ {name}: unsupported baudrate {value!r} "
+                f"(use one of {', '.join(map(str, STANDARD_BAUDRATES))}); using 9600")
+            return 9600
+        return baudrate
+
     def _print_diagnostics(self):
         """Print configuration diagnostics"""
         import logging
@@ -145,7 +252,8 @@ class Config:
         
         for i, battery in enumerate(self.batteries):
             status = "✅" if battery.enabled else "❌"
-            logger.info(f"   Battery {i+1}: {status} {battery.name} (Port: {battery.port}, Address: {battery.address})")
+            logger.info(f"   Battery {i+1}: {status} {battery.name} (Port: {battery.port}, Address: {battery.address}, "
+                        f"{battery.protocol} @ {battery.baudrate} baud)")
         
         logger.info(f"   Virtual battery: {'Yes' if self.enable_virtual_battery else 'No'}")
         if self.enable_virtual_battery:
@@ -159,7 +267,7 @@ class Config:
     
     def load_addon_options(self) -> Dict:
         """Load options from Home Assistant add-on options.json"""
-        options_file = Path('/data/options.json')
+        options_file = Path(OPTIONS_PATH)
         if options_file.exists():
             try:
                 with open(options_file, 'r') as f:
@@ -191,6 +299,92 @@ class Config:
         return 2.0
 
 
+class ConfigDiff:
+    """What a reload changed.
+
+    Batteries are matched by name (entities and energy counters are keyed by
+    it) and only enabled ones count: added, removed, and changed (new
+    BatteryConfig of a battery whose port/address/baudrate/protocol/timeout
+    differ). settings lists the other options that changed; the MQTT
+    publisher takes over its publishing options from config (the new
+    snapshot), the rest take effect after a restart.
+    """
+
+    def __init__(self, old: Config, new: Config) -> None:
+        self.config = new
+        before = {b.name: b for b in old.get_enabled_batteries()}
+        after = {b.name: b for b in new.get_enabled_batteries()}
+        self.added = [b for name, b in after.items() if name not in before]
+        self.removed = [b for name, b in before.items() if name not in after]
+        self.changed = [b for name, b in after.items()
+                        if name in before and b.identity() != before[name].identity()]
+
+        skip = {'batteries', '_frozen'}
+        keys = (set(vars(old)) | set(vars(new))) - skip
+        self.settings = sorted(k for k in keys if getattr(old, k, None) != getattr(new, k, None))
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed or self.settings)
+
+    def summary(self) -> str:
+        parts = []
+        for label, batteries in (('added', self.added), ('removed', self.removed), ('re-timed/moved', self.changed)):
+            if batteries:
+                parts.append(f"{label}: {', '.join(b.name for b in batteries)}")
+        if self.settings:
+            parts.append(f"settings: {', '.join(self.settings)}")
+        return "; ".join(parts) or "no changes"
+
+
+_config: Optional[Config] = None
+_config_lock = threading.Lock()
+
+
 def get_config() -> Config:
-    """Factory function to get configuration"""
-    return Config()
+    """Shared configuration snapshot (options are parsed on first use only)"""
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = Config()
+        return _config
+
+
+def reload_config() -> Tuple[Config, Optional[ConfigDiff]]:
+    """Parse the options again and replace the shared snapshot.
+
+    Returns the new snapshot and its diff against the previous one (None
+    when nothing was loaded before).
+    """
+    global _config
+    new = Config()
+    with _config_lock:
+        old, _config = _config, new
+    return new, (ConfigDiff(old, new) if old is not None else None)
+
+
+class OptionsWatcher:
+    """Detects edits of options.json by polling its mtime and size.
+
+    poll() is cheap (one stat) and meant to be called once per cycle; it
+    reloads the configuration when the file changed and returns the diff.
+    """
+
+    def __init__(self, path: str = OPTIONS_PATH) -> None:
+        self.path = path
+        self._signature = self._stat()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def poll(self) -> Optional[ConfigDiff]:
+        signature = self._stat()
+        if signature == self._signature:
+            return None
+        self._signature = signature
+        get_config()
+        _, diff = reload_config()
+        return diff
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Asyncio engine: non-blocking Service 42 transport, async battery reader and
+async MQTT publish path, all driven by a single event loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import serial
+
+from modbus import SerialPortManager, ExchangeTiming, _wait_for_serial, build_service_42_frame
+from multi_battery import MultiBatteryManager, Reading
+from bms_parser import BMSFrame
+from addon_config import BatteryConfig
+from mqtt_helper import MultiBatteryMQTTPublisher
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSerialTransport:
+    """Non-blocking serial transport for the Service 42 ASCII exchange.
+
+    Handles come from a SerialPortManager of its own (one per bus, reopened
+    when the device node is re-enumerated) opened with timeout=0; response
+    bytes are awaited via the event loop's reader callbacks, so a slow pack
+    never blocks the loop. Requests on one bus are serialized with an
+    asyncio.Lock.
+    """
+
+    def __init__(self, ports: Optional[SerialPortManager] = None) -> None:
+        self._ports = ports or SerialPortManager()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def request_device_info(
+        self,
+        port: str,
+        address: int = 0x01,
+        baudrate: int = 9600,
+        timeout: float = 2.0,
+        first_byte_timeout: Optional[float] = None,
+        timing: Optional[ExchangeTiming] = None
+    ) -> bytes:
+        """Async counterpart of modbus.request_device_info"""
+        # Device may still be enumerating; wait without blocking the loop or holding the bus
+        await asyncio.get_running_loop().run_in_executor(None, _wait_for_serial, port)
+        key = self._ports.bus_key(port)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        frame = build_service_42_frame(address)
+        async with lock:
+            ser = await self._acquire(port, key, baudrate)
+            try:
+                logger.debug(f"📤 Sending: {frame}")
+                response = await self._exchange(ser, frame, timeout, first_byte_timeout, timing)
+            except (serial.SerialException, OSError):
+                self._ports.close(port)
+                raise
+        logger.debug(f"📨 Received ({len(response)} bytes): {response}")
+        return response
+
+    async def _acquire(self, port: str, key: str, baudrate: int) -> serial.Serial:
+        """Async counterpart of SerialPortManager._acquire (non-blocking handle)"""
+        ser = self._ports.reuse_handle(port, key, baudrate, 0)
+        if ser is None:
+            ser = self._ports.open_handle(port, self._ports.refresh_bus_key(port), baudrate, 0)
+        return ser
+
+    async def _exchange(
+        self,
+        ser: serial.Serial,
+        frame: bytes,
+        timeout: float,
+        first_byte_timeout: Optional[float] = None,
+        timing: Optional[ExchangeTiming] = None
+    ) -> bytes:
+        """Write frame and collect the reply up to the first CR or until timeout."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        first_byte_deadline = deadline
+        if first_byte_timeout is not None:
+            first_byte_deadline = min(deadline, started + first_byte_timeout)
+        fd = ser.fileno()
+
+        # Drop stale bytes left over from a previous (timed out) exchange
+        ser.reset_input_buffer()
+        ser.reset_output_buffer()
+        ser.write(frame)
+
+        buf = bytearray()
+        while True:
+            chunk = ser.read(ser.in_waiting or 1)
+            if chunk:
+                if not buf and timing is not None:
+                    timing.first_byte = loop.time() - started
+                buf += chunk
+                cr = buf.find(b'\r')
+                if cr != -1:
+                    if timing is not None:
+                        timing.total = loop.time() - started
+                    # Do NOT keep bytes after the first CR as it corrupts framing
+                    return bytes(buf[:cr + 1])
+                continue
+
+            remaining = (deadline if buf else first_byte_deadline) - loop.time()
+            if remaining <= 0:
+                return bytes(buf)
+
+            readable = loop.create_future()
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait_for(readable, remaining)
+            except asyncio.TimeoutError:
+                return bytes(buf)
+            finally:
+                loop.remove_reader(fd)
+
+    def close_all(self) -> None:
+        """Close every open handle"""
+        self._ports.close_all()
+
+
+class AsyncBatteryReader:
+    """Reads all batteries through AsyncSerialTransport.
+
+    Buses are polled concurrently as tasks on the event loop; batteries on
+    one bus are awaited in order. Parsing, enhancement and aggregation are
+    shared with MultiBatteryManager.
+    """
+
+    def __init__(self, manager: MultiBatteryManager, transport: Optional[AsyncSerialTransport] = None) -> None:
+        self.manager = manager
+        self.transport = transport or AsyncSerialTransport()
+
+    async def read_all_batteries(self) -> Dict[str, BMSFrame]:
+        # Keeps background scans (hot-plug) off the buses while polling, as the threaded reader does
+        self.manager.polling = True
+        try:
+            enabled_batteries = self.manager.start_cycle()
+            buses = self.manager.group_by_bus(enabled_batteries)
+
+            started = time.monotonic()
+            readings: Dict[str, Reading] = {}
+            for bus_readings in await asyncio.gather(*(self._read_bus(b) for b in buses.values())):
+                readings.update(bus_readings)
+            return self.manager.finish_cycle(enabled_batteries, readings, time.monotonic() - started)
+        finally:
+            self.manager.polling = False
+
+    async def get_all_data(self) -> Dict[str, Any]:
+        """Async counterpart of MultiBatteryManager.get_all_data"""
+        return self.manager.attach_virtual_data(await self.read_all_batteries())
+
+    async def _read_bus(self, batteries: List[BatteryConfig]):
+        readings = {}
+        for battery in batteries:
+            logger.info(f"📤 Reading {battery.name} (Port: {battery.port}, Address: {battery.address})")
+            try:
+                readings[battery.name] = (await self._read_single_battery(battery), None)
+            except Exception as e:
+                readings[battery.name] = (None, e)
+        return readings
+
+    async def _read_single_battery(self, battery: BatteryConfig) -> Optional[BMSFrame]:
+        timeout, first_byte_timeout = self.manager.timeouts_for(battery)
+        timing = ExchangeTiming()
+        device_info = await self.transport.request_device_info(
+            port=battery.port,
+            address=battery.address,
+            baudrate=battery.baudrate,
+            timeout=timeout,
+            first_byte_timeout=first_byte_timeout,
+            timing=timing
+        )
+        self.manager.record_latency(battery, timing)
+        return self.manager.decode_response(battery, device_info)
+
+
+class AsyncMQTTPublisher:
+    """Async publish path on top of MultiBatteryMQTTPublisher.
+
+    Connection waits use asyncio.sleep instead of blocking the caller. The
+    publisher's calls are blocking (paho, the in-flight window, reconnect
+    waits), so they never run on the loop: the publish queue's samples go
+    through one worker thread that may wait for in-flight slots, other calls
+    (run()) through the default executor, where a full window fails fast.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, publisher: Optional[MultiBatteryMQTTPublisher] = None) -> None:
+        self.publisher = publisher or MultiBatteryMQTTPublisher()
+        self._publish_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="mqtt-publish", initializer=self.publisher.register_publish_worker
+        )
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking publisher call off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    @property
+    def connected(self) -> bool:
+        return self.publisher.connected
+
+    async def _wait_connected(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.publisher.connected and loop.time() < deadline:
+            await asyncio.sleep(self.POLL_INTERVAL)
+        return self.publisher.connected
+
+    async def connect(self, timeout: float = 10, retries: int = 3) -> bool:
+        """Connect to the broker with retries without blocking the loop"""
+        for attempt in range(retries):
+            try:
+                logger.info(f"📡 Attempt #{attempt + 1}: Connecting to MQTT "
+                            f"{self.publisher.connection_config.mqtt_host}:{self.publisher.connection_config.mqtt_port}")
+                self.publisher.start_connect()
+                if await self._wait_connected(timeout):
+                    logger.info("✅ MQTT connection successful")
+                    return True
+                logger.warning(f"⏱️ Timeout waiting for MQTT connection ({timeout}s)")
+            except Exception as e:
+                logger.error(f"❌ MQTT connection error (attempt #{attempt + 1}): {e}")
+
+            if attempt < retries - 1:
+                await asyncio.sleep(5 * (attempt + 1))  # Progressive backoff
+
+        logger.error(f"❌ Failed to connect to MQTT after {retries} attempts")
+        return False
+
+    async def ensure_connected(self, timeout: float = 5) -> bool:
+        if self.publisher.connected:
+            return True
+        # Only triggers the (rate-limited) reconnect, a blocking socket connect; waiting happens here
+        await self.run(self.publisher.ensure_connected, timeout=0)
+        return await self._wait_connected(timeout)
+
+    async def publish_multi_battery_discovery(self, battery_names: List[str]) -> bool:
+        if not await self.ensure_connected(timeout=3):
+            logger.error("❌ Not connected to MQTT - cannot publish discovery")
+            return False
+        return await self.run(self.publisher.publish_multi_battery_discovery, battery_names)
+
+    async def publish_all_battery_data(self, all_data: Dict[str, Dict[str, Any]],
+                                       failed: Optional[List[str]] = None) -> bool:
+        """Sink of the publish queue's async worker (see PublishQueue.run_async)"""
+        if not await self.ensure_connected(timeout=3):
+            logger.error("❌ Not connected to MQTT - cannot publish data")
+            if failed is not None:
+                failed.extend(all_data)
+            return False
+        publish = functools.partial(self.publisher.publish_all_battery_data, all_data, reconnect_timeout=0, failed=failed)
+        return await asyncio.get_running_loop().run_in_executor(self._publish_executor, publish)
+
+    def disconnect(self) -> None:
+        self.publisher.disconnect()
+        self._publish_executor.shutdown(wait=False)
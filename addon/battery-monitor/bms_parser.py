@@ -4,12 +4,426 @@
 BMS Parser pro Daren BMS Service 42 response
 """
 
+import binascii
 import json
+import struct
+import sys
+from array import array
+from typing import Any, Dict, List, Optional
+
+
+# Precompiled layouts of the binary Service 42 frame (big-endian)
+_HEADER = struct.Struct('>BBBBH')        # VER, ADR, CID1, RTN, LENGTH
+_INFO_HEAD = struct.Struct('>BHHB')      # DATAFLAG, SOC, pack voltage, cell count
+_TEMPS_HEAD = struct.Struct('>hhhB')     # ENV_TEMP, pack_TEMP, MOS_TEMP, TOT_TEMPs
+_INFO_TAIL = struct.Struct('>hHHBHHH')   # current, IR, SOH, user_custom, full/remaining capacity, cycles
+_STATUS_WORDS = 15
+_TRAILER = struct.Struct('>BH')          # machine status list, IO status list
+_CHECKSUM_SIZE = 2
+
+_STATUS_FIELDS = (
+    "voltage_status", "current_status", "temperature_status", "alarm_status", "fet_status",
+    "overvoltage_protection_status_low", "undervolt_protection_status_low",
+    "overvoltage_alarm_status_low", "undervolt_alarm_status_low",
+    "cell_balance_state_low", "cell_balance_state_high",
+    "overvoltage_protection_status_high", "undervolt_protection_status_high",
+    "overvoltage_alarm_status_high", "undervolt_alarm_status_high"
+)
+
+# Every byte value that is not an ASCII hex digit (for sanitizing noisy payloads)
+_NON_HEX = bytes(b for b in range(256) if b not in b'0123456789abcdefABCDEF')
+
+_SWAP_WORDS = sys.byteorder == 'little'
+
+
+def _word_array(typecode: str, frame: bytes, offset: int, count: int) -> array:
+    """Big-endian 16-bit words from frame as a native array"""
+    words = array(typecode)
+    words.frombytes(frame[offset:offset + 2 * count])
+    if _SWAP_WORDS:
+        words.byteswap()
+    return words
+
+
+class FrameChecksumError(ValueError):
+    """Service 42 frame rejected because a checksum does not match.
+
+    kind is 'length' for the LCHKSUM nibble of the LENGTH field and 'frame'
+    for the trailing CHKSUM over the ASCII payload.
+    """
+
+    def __init__(self, kind: str, expected: int, received: int):
+        self.kind = kind
+        self.expected = expected
+        self.received = received
+        width = 1 if kind == 'length' else 4
+        super().__init__(
+            f"{kind.capitalize()} checksum mismatch: expected {expected:0{width}X}, received {received:0{width}X}"
+        )
+
+
+def length_checksum(length_id: int) -> int:
+    """LCHKSUM nibble: two's complement of the sum of the three LENID nibbles (mod 16)"""
+    return -((length_id & 0xF) + ((length_id >> 4) & 0xF) + ((length_id >> 8) & 0xF)) & 0xF
+
+
+def frame_checksum(ascii_payload: bytes) -> int:
+    """CHKSUM: two's complement of the sum of ASCII codes between SOI and CHKSUM (mod 65536)"""
+    return -sum(ascii_payload) & 0xFFFF
+
+
+class BMSFrame:
+    """Compact record of one Service 42 reading.
+
+    Values are kept as the raw integers from the frame; cell voltages (mV)
+    and cell temperatures (0.1 °C) live in 16-bit arrays and are scaled only
+    when read. The legacy dictionary keys are available through get(), [] and
+    `in`, and to_dict() returns the dictionary the parser used to build.
+    """
+
+    __slots__ = (
+        'ver', 'adr', 'cid1', 'rtn', 'length_field', 'checksum', 'data_flag',
+        'soc_raw', 'pack_voltage_raw', 'cell_mv',
+        'ambient_raw', 'pack_avg_raw', 'mos_raw', 'cell_temps_raw',
+        'current_raw', 'internal_resistance_raw', 'soh_percent', 'user_defined_number',
+        'full_capacity_raw', 'remaining_capacity_raw', 'cycle_count',
+        'status_words', 'machine_status', 'io_status',
+        # Identification and energy counters filled in by MultiBatteryManager
+        'battery_name', 'battery_address', 'battery_port', 'energy_in_kwh', 'energy_out_kwh',
+    )
+
+    # Keys of the parser dictionary
+    PARSED_KEYS = (
+        "ver_hex", "adr_hex", "cid1_hex", "rtn_code_hex", "length_field", "checksum_hex",
+        "data_flag_hex", "soc_percent", "pack_voltage_v", "cell_count", "cell_voltages_v",
+        "ambient_temp_c", "pack_avg_temp_c", "mos_temp_c", "temp_sensor_count", "cell_temps_c",
+        "pack_current_a", "pack_internal_resistance_mohm", "soh_percent", "user_defined_number",
+        "full_charge_capacity_ah", "remaining_capacity_ah", "cycle_count", "status_flags_hex",
+        "machine_status_list_hex", "io_status_list_hex",
+    )
+    # Keys added for publishing (identification, derived values, energy)
+    ENHANCED_KEYS = (
+        "battery_name", "battery_address", "battery_port", "power_w", "temperature_1_c",
+        "full_capacity_ah", "min_cell_voltage_v", "max_cell_voltage_v", "cell_voltage_diff_v",
+        "status", "energy_in_kwh", "energy_out_kwh",
+    )
+    _KEYS = frozenset(PARSED_KEYS + ENHANCED_KEYS)
+
+    def __init__(self, header: tuple, checksum: int, data_flag: int, soc_raw: int, pack_voltage_raw: int,
+                 cell_mv: array, temps: tuple, cell_temps_raw: array, tail: tuple,
+                 status_words: array, trailer: tuple):
+        self.ver, self.adr, self.cid1, self.rtn, self.length_field = header
+        self.checksum = checksum
+        self.data_flag = data_flag
+        self.soc_raw = soc_raw
+        self.pack_voltage_raw = pack_voltage_raw
+        self.cell_mv = cell_mv
+        self.ambient_raw, self.pack_avg_raw, self.mos_raw = temps
+        self.cell_temps_raw = cell_temps_raw
+        (self.current_raw, self.internal_resistance_raw, self.soh_percent, self.user_defined_number,
+         self.full_capacity_raw, self.remaining_capacity_raw, self.cycle_count) = tail
+        self.status_words = status_words
+        self.machine_status, self.io_status = trailer
+        self.battery_name: Optional[str] = None
+        self.battery_address: Optional[int] = None
+        self.battery_port: Optional[str] = None
+        self.energy_in_kwh = 0.0
+        self.energy_out_kwh = 0.0
+
+    # --- Scaled values -------------------------------------------------
+
+    @property
+    def soc_percent(self) -> float:
+        return self.soc_raw / 100.0
+
+    @property
+    def pack_voltage_v(self) -> float:
+        return self.pack_voltage_raw / 100.0
+
+    @property
+    def cell_count(self) -> int:
+        return len(self.cell_mv)
+
+    @property
+    def cell_voltages_v(self) -> List[float]:
+        return [mv / 1000.0 for mv in self.cell_mv]
+
+    @property
+    def ambient_temp_c(self) -> float:
+        return self.ambient_raw / 10.0
+
+    @property
+    def pack_avg_temp_c(self) -> float:
+        return self.pack_avg_raw / 10.0
+
+    @property
+    def mos_temp_c(self) -> float:
+        return self.mos_raw / 10.0
+
+    @property
+    def temp_sensor_count(self) -> int:
+        return len(self.cell_temps_raw)
+
+    @property
+    def cell_temps_c(self) -> List[float]:
+        return [t / 10.0 for t in self.cell_temps_raw]
+
+    @property
+    def pack_current_a(self) -> float:
+        return self.current_raw / 100.0
+
+    @property
+    def pack_internal_resistance_mohm(self) -> float:
+        return self.internal_resistance_raw / 10.0  # Assumption: mOhm
+
+    @property
+    def full_charge_capacity_ah(self) -> float:
+        return self.full_capacity_raw / 100.0
+
+    @property
+    def remaining_capacity_ah(self) -> float:
+        return self.remaining_capacity_raw / 100.0
+
+    # --- Raw hex fields (formatted on demand) --------------------------
+
+    @property
+    def ver_hex(self) -> str:
+        return f"{self.ver:02X}"
+
+    @property
+    def adr_hex(self) -> str:
+        return f"{self.adr:02X}"
+
+    @property
+    def cid1_hex(self) -> str:
+        return f"{self.cid1:02X}"
+
+    @property
+    def rtn_code_hex(self) -> str:
+        return f"{self.rtn:02X}"
+
+    @property
+    def length_field_dict(self) -> Dict[str, Any]:
+        info_len_chars = self.length_field & 0x0FFF
+        return {
+            "hex": f"{self.length_field:04X}",
+            "info_len_chars": info_len_chars,
+            "info_len_bytes": info_len_chars // 2,
+            "len_checksum_nibble_hex": f"{self.length_field >> 12:X}"
+        }
+
+    @property
+    def checksum_hex(self) -> str:
+        return f"{self.checksum:04X}"
+
+    @property
+    def data_flag_hex(self) -> str:
+        return f"{self.data_flag:02X}"
+
+    @property
+    def status_flags_hex(self) -> Dict[str, str]:
+        return {desc: f"{word:04X}" for desc, word in zip(_STATUS_FIELDS, self.status_words)}
+
+    @property
+    def machine_status_list_hex(self) -> str:
+        return f"{self.machine_status:02X}"
+
+    @property
+    def io_status_list_hex(self) -> str:
+        return f"{self.io_status:04X}"
+
+    # --- Derived values used for publishing ----------------------------
+
+    @property
+    def power_w(self) -> float:
+        return self.pack_voltage_v * self.pack_current_a
+
+    @property
+    def temperature_1_c(self) -> float:
+        return self.ambient_temp_c
+
+    @property
+    def full_capacity_ah(self) -> float:
+        return self.full_charge_capacity_ah
+
+    @property
+    def min_cell_voltage_v(self) -> float:
+        return min(self.cell_mv) / 1000.0 if self.cell_mv else 0.0
+
+    @property
+    def max_cell_voltage_v(self) -> float:
+        return max(self.cell_mv) / 1000.0 if self.cell_mv else 0.0
+
+    @property
+    def cell_voltage_diff_v(self) -> float:
+        return (max(self.cell_mv) - min(self.cell_mv)) / 1000.0 if self.cell_mv else 0.0
+
+    @property
+    def status(self) -> str:
+        current = self.pack_current_a
+        if current > 0.1:
+            return 'charging'
+        if current < -0.1:
+            return 'discharging'
+        return 'idle'
+
+    # --- Read-only mapping access over the legacy keys -----------------
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        if key == "length_field":
+            return self.length_field_dict
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._KEYS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self._KEYS:
+            return default
+        return self[key]
+
+    def to_dict(self, enhanced: bool = True) -> Dict[str, Any]:
+        """Legacy dictionary form (parser keys, plus publishing keys when enhanced)"""
+        keys = self.PARSED_KEYS + self.ENHANCED_KEYS if enhanced else self.PARSED_KEYS
+        return {key: self[key] for key in keys}
 
 
 class BMSParser:
     """Parser pro Service 42 (GetDeviceInfo) odpovědi z Daren BMS"""
 
+    @staticmethod
+    def extract_payload(raw: bytes) -> memoryview:
+        """ASCII hex payload between '~' and the first CR of a raw response (no copy)"""
+        start = raw.find(b'~')
+        start = 0 if start == -1 else start + 1
+        end = raw.find(b'\r', start)
+        if end == -1:
+            end = len(raw)
+        return memoryview(raw)[start:end]
+
+    @staticmethod
+    def verify_checksums(length_field: int, checked_ascii: bytes, checksum: int) -> None:
+        """
+        Ověří LENGTH checksum nibble a CHKSUM rámce.
+
+        Args:
+            length_field: 16-bit LENGTH field (LCHKSUM nibble + 12-bit LENID)
+            checked_ascii: ASCII characters covered by CHKSUM (VER .. end of INFO)
+            checksum: Received CHKSUM
+
+        Raises:
+            FrameChecksumError: if either checksum does not match
+        """
+        expected = length_checksum(length_field & 0x0FFF)
+        if expected != length_field >> 12:
+            raise FrameChecksumError('length', expected, length_field >> 12)
+        expected = frame_checksum(checked_ascii)
+        if expected != checksum:
+            raise FrameChecksumError('frame', expected, checksum)
+
+    @staticmethod
+    def parse_frame(raw: bytes, validate: bool = True) -> BMSFrame:
+        """
+        Parsuje Service 42 response přímo z bytes ze sériového portu.
+
+        Hex ASCII is decoded once with binascii and the binary frame is read
+        with precompiled struct layouts; cell voltages and temperatures are
+        copied straight into 16-bit arrays. Both checksums are verified right
+        after the length check, before the INFO block is decoded.
+
+        Args:
+            raw: Raw response (with or without '~' and '\r')
+            validate: Verify LENGTH and frame checksums (FrameChecksumError on mismatch)
+
+        Returns:
+            BMSFrame s parsovanými daty
+        """
+        if not isinstance(raw, (bytes, bytearray)):
+            raise TypeError("Vstup musí být bytes")
+
+        payload = BMSParser.extract_payload(raw)
+        try:
+            frame = binascii.unhexlify(payload)
+        except binascii.Error:
+            # Noisy line: drop anything that is not a hex digit and retry
+            payload = memoryview(payload.tobytes().translate(None, _NON_HEX))
+            try:
+                frame = binascii.unhexlify(payload)
+            except binascii.Error as e:
+                raise ValueError(f"Response is not valid hex ASCII: {e}") from None
+
+        if len(frame) < _HEADER.size + _CHECKSUM_SIZE:
+            raise ValueError(f"Response too short: {len(payload)} characters")
+
+        header = _HEADER.unpack_from(frame)
+        # LSB 12 bits for INFO length in characters (nibbles)
+        info_len_chars = header[4] & 0x0FFF
+
+        # Length = header_without_len(8) + len(4) + info_len_chars + checksum(4)
+        expected_total_len_chars = 8 + 4 + info_len_chars + 4
+        if len(payload) != expected_total_len_chars:
+            raise ValueError(
+                f"Length mismatch. Header indicates INFO length (chars): {info_len_chars}. "
+                f"Expected total length: {expected_total_len_chars}, Received: {len(payload)}"
+            )
+
+        # Cheap rejection of corrupted frames before any INFO decoding
+        if validate:
+            BMSParser.verify_checksums(header[4], payload[:-4], (frame[-2] << 8) | frame[-1])
+
+        info_start = _HEADER.size
+        info_end = info_start + info_len_chars // 2
+        ptr = info_start
+
+        def need(size: int) -> None:
+            if ptr + size > info_end:
+                raise ValueError(
+                    f"Attempt to read beyond INFO block boundaries: need {size * 2} from position "
+                    f"{(ptr - info_start) * 2} in block of length {info_len_chars}"
+                )
+
+        need(_INFO_HEAD.size)
+        data_flag, soc, pack_voltage, cell_count = _INFO_HEAD.unpack_from(frame, ptr)
+        ptr += _INFO_HEAD.size
+
+        need(2 * cell_count + _TEMPS_HEAD.size)
+        cell_mv = _word_array('H', frame, ptr, cell_count)
+        ptr += 2 * cell_count
+        *temps, tot_temps = _TEMPS_HEAD.unpack_from(frame, ptr)
+        ptr += _TEMPS_HEAD.size
+
+        need(2 * tot_temps + _INFO_TAIL.size + 2 * _STATUS_WORDS + _TRAILER.size)
+        cell_temps = _word_array('h', frame, ptr, tot_temps)
+        ptr += 2 * tot_temps
+        tail = _INFO_TAIL.unpack_from(frame, ptr)
+        ptr += _INFO_TAIL.size
+        status_words = _word_array('H', frame, ptr, _STATUS_WORDS)
+        ptr += 2 * _STATUS_WORDS
+        trailer = _TRAILER.unpack_from(frame, ptr)
+        ptr += _TRAILER.size
+
+        if ptr != info_end:
+            raise ValueError(
+                f"Error parsing INFO block. Expected {info_len_chars} characters, "
+                f"read {(ptr - info_start) * 2} characters."
+            )
+
+        checksum = (frame[info_end] << 8) | frame[info_end + 1]
+        return BMSFrame(header, checksum, data_flag, soc, pack_voltage, cell_mv, tuple(temps),
+                        cell_temps, tail, status_words, trailer)
+
+    @staticmethod
+    def parse_service_42_bytes(raw: bytes, validate: bool = True) -> dict:
+        """
+        Parsuje Service 42 response z bytes a vrací dictionary.
+
+        Same keys as parse_service_42_response; see parse_frame for the
+        compact form used by the monitoring loop.
+        """
+        return BMSParser.parse_frame(raw, validate).to_dict(enhanced=False)
+
     @staticmethod
     def _hex_to_int(hex_str: str) -> int:
         """Převod hex stringu na integer"""
@@ -26,12 +440,13 @@ class BMSParser:
         return val
 
     @staticmethod
-    def parse_service_42_response(hex_data_string: str) -> dict:
+    def parse_service_42_response(hex_data_string: str, validate: bool = True) -> dict:
         """
         Parsuje Service 42 response a vrací dictionary.
         
         Args:
             hex_data_string: Hex string odpovědi (bez ~ a \r)
+            validate: Verify LENGTH and frame checksums (FrameChecksumError on mismatch)
             
         Returns:
             Dictionary s parsovanými daty
@@ -77,6 +492,13 @@ class BMSParser:
         ptr += info_len_chars
         data["checksum_hex"] = hex_data_string[ptr : ptr + 4] # Last 4 characters (2 bytes)
 
+        if validate:
+            BMSParser.verify_checksums(
+                BMSParser._hex_to_int(length_field_hex),
+                hex_data_string[:ptr].encode('ascii'),
+                BMSParser._hex_to_int(data["checksum_hex"])
+            )
+
         # 2. Parse INFO block (99 bytes / 198 characters in example)
         info_ptr = 0 # Pointer within info_hex_block
 
@@ -201,4 +623,23 @@ if __name__ == "__main__":
         print("✅ Parsing successful!")
         print(json.dumps(result, indent=2, ensure_ascii=False))
     except Exception as e:
-        print(f"❌ Error: {e}")
\ No newline at end of file
+        print(f"❌ Error: {e}")
+
+    print("=== Bytes parser vs hex-string parser: timing ===")
+    import timeit
+
+    test_raw = b"~" + test_hex.encode("ascii") + b"\r"
+
+    def legacy_path():
+        # Previous read path: sanitize hex per character, then parse the string
+        payload = BMSParser.extract_payload(test_raw).tobytes().decode("ascii", errors="ignore")
+        hex_data = "".join(ch for ch in payload if ch in "0123456789abcdefABCDEF").upper()
+        return BMSParser.parse_service_42_response(hex_data)
+
+    rounds = 5000
+    t_legacy = timeit.timeit(legacy_path, number=rounds)
+    t_bytes = timeit.timeit(lambda: BMSParser.parse_service_42_bytes(test_raw), number=rounds)
+    t_frame = timeit.timeit(lambda: BMSParser.parse_frame(test_raw), number=rounds)
+    print(f"hex string: {t_legacy / rounds * 1e6:.1f} µs/frame")
+    print(f"bytes:      {t_bytes / rounds * 1e6:.1f} µs/frame ({t_legacy / t_bytes:.1f}x faster)")
+    print(f"BMSFrame:   {t_frame / rounds * 1e6:.1f} µs/frame ({t_legacy / t_frame:.1f}x faster)")
\ No newline at end of file
@@ -3,6 +3,26 @@
 One-off discovery tool: scans available serial ports for Daren BMS devices
 by trying Service 42 on a range of Modbus addresses. Emits a ready-to-copy
 YAML snippet and stores it under /data/discovered_batteries.yaml.
+
+Ports are scanned concurrently (one worker per bus, addresses in order on
+each bus over the pooled serial handle). Once a device answered, a sweep
+stops early after discovery_max_misses consecutive silent addresses; before
+the first hit the whole range is swept, so packs at high addresses are found.
+
+A bus runs at one line speed, so it is worked out once per port: the address
+range is swept at the first of discovery_baudrates with every protocol in
+discovery_protocols (Service 42 ASCII and a Modbus RTU register read), and
+the next speed is swept only when nothing answered. Per address, the
+protocol that last answered on the port is tried first.
+
+Found devices are kept in an inventory (/data/discovery_inventory.json) keyed
+by bus and address, with the pack's fingerprint (cell count, temperature
+sensor count, full capacity, user-defined number). With discovery_incremental
+known devices are first re-verified with their recorded baud rate and
+protocol, then only the remaining addresses are swept. A known address whose
+fingerprint changed is reported as swapped. The bus is the adapter's by-id
+link, else the resolved device path, so a device scanned once as /dev/ttyUSB0
+and once through its by-id link (or re-enumerated) keeps its entry.
 """
 
 from __future__ import annotations
@@ -11,14 +31,91 @@ import glob
 import json
 import logging
 import os
-from typing import Dict, List, Tuple
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
-from modbus import request_device_info
+from modbus import (
+    ModbusExceptionResponse,
+    SerialPortManager,
+    get_port_manager,
+    parse_modbus_response,
+    request_device_info,
+    send_modbus_request,
+)
 from bms_parser import BMSParser
 
 
 logger = logging.getLogger(__name__)
 
+SERVICE_42 = "service42"
+MODBUS = "modbus"
+PROTOCOLS = (SERVICE_42, MODBUS)
+
+DEFAULT_BAUDRATES = (9600, 19200, 115200)
+
+# Modbus probe: read one holding register; an exception reply also proves a slave
+MODBUS_PROBE = (0x03, 0x0000, 1)
+
+INVENTORY_PATH = "/data/discovery_inventory.json"
+
+# Service 42 fields identifying a pack (full capacity may drift a little as the BMS relearns it)
+PACK_FIELDS = ("cell_count", "temp_sensor_count", "full_charge_capacity_ah", "user_defined_number")
+CAPACITY_TOLERANCE = 0.1
+
+
+def _inventory_key(port: str, address: int) -> str:
+    return f"{SerialPortManager.bus_key(port)}#{address}"
+
+
+def _load_inventory(path: str = INVENTORY_PATH) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        devices = data.get("devices", {})
+        if not isinstance(devices, dict):
+            return {}
+        # Re-key on the bus (entries of older runs were keyed by the path scanned)
+        return {_inventory_key(entry["port"], int(entry["address"])): entry
+                for entry in devices.values() if isinstance(entry, dict) and "port" in entry and "address" in entry}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable discovery inventory {path}: {e}")
+        return {}
+
+
+def _save_inventory(devices: Dict[str, Dict[str, Any]], path: str = INVENTORY_PATH) -> None:
+    try:
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".discovery_inventory.", dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": 1, "devices": devices}, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+        logger.info(f"📝 Discovery inventory saved to: {path} ({len(devices)} device(s))")
+    except Exception as e:
+        logger.warning(f"Could not write discovery inventory: {e}")
+
+
+def _pack_fingerprint(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: parsed.get(field) for field in PACK_FIELDS}
+
+
+def _same_pack(old: Dict[str, Any], new: Dict[str, Any]) -> bool:
+    """Whether two fingerprints describe the same pack (unknown fields match anything)"""
+    for field in PACK_FIELDS:
+        a, b = old.get(field), new.get(field)
+        if a is None or b is None:
+            continue
+        if field == "full_charge_capacity_ah":
+            if abs(a - b) > CAPACITY_TOLERANCE * max(abs(a), abs(b)):
+                return False
+        elif a != b:
+            return False
+    return True
+
 
 def _list_candidate_ports(explicit_ports: List[str] | None = None) -> List[str]:
     if explicit_ports:
@@ -47,32 +144,117 @@ def _list_candidate_ports(explicit_ports: List[str] | None = None) -> List[str]:
     return list(dedup.values())
 
 
-def _try_probe(port: str, address: int, timeout_s: float) -> Tuple[bool, Dict]:
+def _try_probe(port: str, address: int, timeout_s: float, baudrate: int = 9600) -> Tuple[bool, Dict]:
     try:
-        raw = request_device_info(port=port, address=address, baudrate=9600, timeout=timeout_s)
+        raw = request_device_info(
+            port=port,
+            address=address,
+            baudrate=baudrate,
+            timeout=timeout_s,
+            port_manager=get_port_manager(),
+        )
         if not raw or len(raw) < 3:
             return False, {}
-        # Extract ASCII hex between '~' and first CR, keep only hex chars
-        if isinstance(raw, (bytes, bytearray)):
-            start = raw.find(b"~")
-            if start == -1:
-                start = 0
-            end = raw.find(b"\r", start + 1)
-            if end == -1:
-                end = len(raw)
-            payload = raw[start + 1 : end] if start < end else raw[:end]
-            ascii_hex = payload.decode("ascii", errors="ignore")
-        else:
-            ascii_hex = str(raw)
-        hex_data = "".join(ch for ch in ascii_hex if ch in "0123456789abcdefABCDEF").upper()
-        if not hex_data:
-            return False, {}
-        parsed = BMSParser.parse_service_42_response(hex_data)
+        parsed = BMSParser.parse_service_42_bytes(raw)
         return True, parsed
     except Exception:
         return False, {}
 
 
+def _try_modbus_probe(port: str, address: int, timeout_s: float, baudrate: int) -> bool:
+    function_code, start_addr, quantity = MODBUS_PROBE
+    try:
+        raw = send_modbus_request(
+            port, address, function_code, start_addr, quantity,
+            baudrate=baudrate, timeout=timeout_s, port_manager=get_port_manager()
+        )
+        if not raw:
+            return False
+        parse_modbus_response(raw, address, function_code, quantity)
+        return True
+    except ModbusExceptionResponse:
+        # CRC-valid reply from this slave, just not for this register
+        return True
+    except Exception:
+        return False
+
+
+def _fingerprint(port: str, address: int, timeout_s: float, attempts: List[Tuple[int, str]]) -> Optional[Dict]:
+    """Device answering at address with the first (baudrate, protocol) in attempts that works"""
+    for baudrate, protocol in attempts:
+        pack: Dict[str, Any] = {}
+        if protocol == SERVICE_42:
+            ok, parsed = _try_probe(port, address, timeout_s, baudrate)
+            if ok:
+                pack = _pack_fingerprint(parsed)
+        else:
+            ok = _try_modbus_probe(port, address, timeout_s, baudrate)
+        if ok:
+            return {"address": address, "baudrate": baudrate, "protocol": protocol, "pack": pack}
+    return None
+
+
+def _scan_port(port: str, addr_from: int, addr_to: int, timeout_s: float, max_misses: int,
+               attempts: List[Tuple[int, str]], known: Dict[int, Dict[str, Any]] | None = None) -> Dict:
+    """Sweep one port's address range; returns found devices and scan stats.
+
+    known (incremental mode) maps addresses to inventory entries: those are
+    re-verified first with their recorded baud rate and protocol, and the
+    sweep then skips them.
+    """
+    started = time.monotonic()
+    found: Dict[int, Dict] = {}
+    missing: List[int] = []
+    probed = 0
+
+    def learned(hit: Dict) -> None:
+        nonlocal attempts
+        # The bus speed is known now; the same protocol first, then the others
+        combo = (hit["baudrate"], hit["protocol"])
+        attempts = [combo] + [a for a in attempts if a[0] == combo[0] and a != combo]
+
+    for addr, entry in sorted((known or {}).items()):
+        probed += 1
+        hit = _fingerprint(port, addr, timeout_s, [(entry["baudrate"], entry["protocol"])])
+        if hit:
+            found[addr] = hit
+            learned(hit)
+        else:
+            missing.append(addr)
+
+    # One sweep per speed until one finds something (a re-verified device already fixed it)
+    for speed in list(dict.fromkeys(baudrate for baudrate, _ in attempts)):
+        misses = 0
+        for addr in range(addr_from, addr_to + 1):
+            if addr in found:
+                misses = 0
+                continue
+            if known and addr in known:
+                # Re-verified above and silent; do not sweep it again
+                misses += 1
+            else:
+                probed += 1
+                hit = _fingerprint(port, addr, timeout_s, [a for a in attempts if a[0] == speed])
+                if hit:
+                    found[addr] = hit
+                    learned(hit)
+                    misses = 0
+                    continue
+                misses += 1
+            if found and max_misses > 0 and misses >= max_misses:
+                logger.debug(f"Port {port} @ {speed}: {misses} silent address(es), stopping at {addr}")
+                break
+        if found:
+            break
+    return {
+        "port": port,
+        "devices": [found[addr] for addr in sorted(found)],
+        "missing": missing,
+        "probed": probed,
+        "duration_s": round(time.monotonic() - started, 2),
+    }
+
+
 def run_discovery(options: Dict) -> Dict:
     """Run discovery and return summary with results list.
 
@@ -81,11 +263,23 @@ def run_discovery(options: Dict) -> Dict:
       - discovery_address_from: int
       - discovery_address_to: int
       - discovery_timeout_ms: int
+      - discovery_max_misses: int (0 = always sweep the whole range)
+      - discovery_baudrates: List[int] (tried in this order)
+      - discovery_protocols: List[str] ("service42", "modbus"; tried in this order)
+      - discovery_incremental: bool (re-verify inventoried devices, sweep only the rest)
     """
     addr_from = int(options.get("discovery_address_from", 1))
     addr_to = int(options.get("discovery_address_to", 16))
     timeout_ms = int(options.get("discovery_timeout_ms", 300))
+    max_misses = int(options.get("discovery_max_misses", 8))
     ports = _list_candidate_ports(options.get("discovery_ports") or None)
+    baudrates = [int(b) for b in options.get("discovery_baudrates") or DEFAULT_BAUDRATES]
+    protocols = [p for p in options.get("discovery_protocols") or PROTOCOLS if p in PROTOCOLS] or [SERVICE_42]
+    # Baud rate is the outer loop: the default speed with every protocol first
+    attempts = [(b, p) for b in baudrates for p in protocols]
+    incremental = bool(options.get("discovery_incremental", False))
+    inventory_path = options.get("inventory_path", INVENTORY_PATH)
+    inventory = _load_inventory(inventory_path)
 
     timeout_s = max(0.05, min(5.0, timeout_ms / 1000.0))
     if not ports:
@@ -93,28 +287,83 @@ def run_discovery(options: Dict) -> Dict:
         ports = []
 
     logger.info("🔎 ===== BMS DISCOVERY START =====")
-    logger.info(f"Ports: {len(ports)} | Address range: {addr_from}..{addr_to} | Timeout: {timeout_ms} ms")
+    logger.info(f"Ports: {len(ports)} | Address range: {addr_from}..{addr_to} | Timeout: {timeout_ms} ms"
+                f" | Stop after {max_misses or 'no'} silent address(es)")
+    logger.info(f"Baud rates: {', '.join(str(b) for b in baudrates)} | Protocols: {', '.join(protocols)}")
+
+    # Inventoried devices per port (incremental mode re-verifies them first)
+    known: Dict[str, Dict[int, Dict[str, Any]]] = {port: {} for port in ports}
+    if incremental:
+        port_by_bus = {SerialPortManager.bus_key(port): port for port in ports}
+        for entry in inventory.values():
+            port = port_by_bus.get(SerialPortManager.bus_key(entry["port"]))
+            if port is not None:
+                known[port][int(entry["address"])] = entry
+        logger.info(f"Incremental scan: {sum(len(k) for k in known.values())} known device(s) to re-verify")
 
+    started = time.monotonic()
+    scans: List[Dict] = []
+    if ports:
+        with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="bms-scan") as pool:
+            scans = list(pool.map(
+                lambda port: _scan_port(port, addr_from, addr_to, timeout_s, max_misses, attempts, known[port]),
+                ports
+            ))
+
+    now = time.time()
     discovered: List[Dict] = []
-    for port in ports:
-        found_on_port = 0
-        for addr in range(addr_from, addr_to + 1):
-            ok, parsed = _try_probe(port, addr, timeout_s)
-            if not ok:
-                continue
-            found_on_port += 1
-            entry = {
-                "port": port,
+    swapped: List[Dict] = []
+    missing: List[str] = []
+    for scan in scans:
+        for addr in scan["missing"]:
+            missing.append(_inventory_key(scan["port"], addr))
+            logger.warning(f"   {scan['port']} #{addr}: known device did not answer")
+        for device in scan["devices"]:
+            addr = device["address"]
+            key = _inventory_key(scan["port"], addr)
+            previous = inventory.get(key)
+            if previous is None:
+                status = "new"
+            elif _same_pack(previous.get("pack") or {}, device["pack"]):
+                status = "verified"
+            else:
+                status = "swapped"
+                swapped.append({"key": key, "previous": previous.get("pack"), "current": device["pack"]})
+                logger.warning(f"🔀 {scan['port']} #{addr}: a different pack answers now "
+                               f"(was {previous.get('pack')}, now {device['pack']})")
+            inventory[key] = {
+                "port": scan["port"],
+                "address": addr,
+                "baudrate": device["baudrate"],
+                "protocol": device["protocol"],
+                "pack": device["pack"],
+                "first_seen": previous.get("first_seen", now) if status == "verified" else now,
+                "last_seen": now,
+            }
+            discovered.append({
+                "port": scan["port"],
                 "address": addr,
                 # Suggest default name based on address
                 "name": f"Battery_{addr}",
-                "enabled": True,
-            }
-            discovered.append(entry)
-        logger.info(f"Port {port}: {found_on_port} device(s)")
+                "baudrate": device["baudrate"],
+                "protocol": device["protocol"],
+                "status": status,
+                # Monitoring reads Service 42 only
+                "enabled": device["protocol"] == SERVICE_42,
+            })
+            logger.info(f"   {scan['port']} #{addr}: {device['protocol']} @ {device['baudrate']} baud ({status})")
+        logger.info(f"Port {scan['port']}: {len(scan['devices'])} device(s), "
+                    f"{scan['probed']} address(es) probed in {scan['duration_s']:.1f}s")
+
+    # Release the scanned ports; discovery is a one-off run
+    get_port_manager().close_all()
 
     total = len(discovered)
-    logger.info(f"✅ Discovery complete: {total} device(s) found")
+    duration_s = round(time.monotonic() - started, 2)
+    logger.info(f"✅ Discovery complete: {total} device(s) found in {duration_s:.1f}s"
+                f" | swapped: {len(swapped)} | missing: {len(missing)}")
+
+    _save_inventory(inventory, inventory_path)
 
     # Build YAML snippet
     yaml_lines: List[str] = []
@@ -125,7 +374,12 @@ def run_discovery(options: Dict) -> Dict:
         yaml_lines.append(f"  - port: \"{d['port']}\"")
         yaml_lines.append(f"    address: {d['address']}")
         yaml_lines.append(f"    name: \"{d['name']}\"")
-        yaml_lines.append(f"    enabled: true")
+        yaml_lines.append(f"    baudrate: {d['baudrate']}")
+        yaml_lines.append(f"    protocol: {d['protocol']}")
+        if d["enabled"]:
+            yaml_lines.append("    enabled: true")
+        else:
+            yaml_lines.append("    enabled: false  # answers Modbus only; not polled yet")
     yaml_lines.append("enable_virtual_battery: true")
     yaml_lines.append("# === End of generated block ===")
     yaml_text = "\n".join(yaml_lines)
@@ -144,7 +398,8 @@ def run_discovery(options: Dict) -> Dict:
     try:
         json_path = "/data/discovered_batteries.json"
         with open(json_path, "w") as f:
-            json.dump({"count": total, "results": discovered}, f)
+            json.dump({"count": total, "results": discovered, "swapped": swapped, "missing": missing,
+                       "ports": scans, "duration_s": duration_s}, f)
         logger.info(f"📝 Discovery JSON saved to: {json_path}")
     except Exception:
         pass
@@ -153,5 +408,6 @@ def run_discovery(options: Dict) -> Dict:
     preview = "\n".join(yaml_lines[: min(len(yaml_lines), 20)])
     logger.info("\n" + preview)
 
-    return {"count": total, "results": discovered, "yaml_path": out_path}
+    return {"count": total, "results": discovered, "swapped": swapped, "missing": missing,
+            "ports": scans, "duration_s": duration_s, "yaml_path": out_path}
 
@@ -10,11 +10,13 @@ total_increasing sensors.
 
 from __future__ import annotations
 
+import atexit
 import json
 import os
 import time
+import zlib
 from threading import RLock
-from typing import Dict, Tuple
+from typing import Dict, Mapping, Optional, Set, Tuple
 
 
 DEFAULT_STORAGE_PATHS = [
@@ -23,20 +25,182 @@ DEFAULT_STORAGE_PATHS = [
 ]
 
 
+def _fsync_dir(path: str) -> None:
+    """Make a rename/creation in path's directory durable"""
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_snapshot(path: str, state: Dict[str, Dict[str, float]]) -> None:
+    """Atomically replace path with the JSON state (tmp + fsync + rename)"""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def _read_snapshot(path: str) -> Dict[str, Dict[str, float]]:
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            data = json.load(f)
+            if isinstance(data, dict):
+                return data
+    return {}
+
+
+class SnapshotStorage:
+    """Whole state as one JSON file, rewritten on every save"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> Dict[str, Dict[str, float]]:
+        return _read_snapshot(self.path)
+
+    def save(self, state: Dict[str, Dict[str, float]], changed: Set[str]) -> None:
+        _write_snapshot(self.path, state)
+
+    def close(self, state: Dict[str, Dict[str, float]]) -> None:
+        pass
+
+
+class JournalStorage:
+    """Append-only journal of per-device counter records plus a JSON snapshot.
+
+    - save() appends one line per changed device, so a write costs the same
+      however many devices are tracked; each line carries a CRC32 and the
+      device's new totals (not deltas), so replaying a record twice - e.g.
+      after a crash between compaction and journal truncation - is harmless
+    - load() reads the snapshot, then replays valid journal lines in order;
+      a torn or corrupted line (crash mid-append) is skipped
+    - once the journal exceeds compact_bytes it is folded into the snapshot
+      (the same file and format SnapshotStorage uses) and truncated
+    """
+
+    COMPACT_BYTES = 256 * 1024
+
+    def __init__(self, path: str, compact_bytes: int = COMPACT_BYTES) -> None:
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.compact_bytes = compact_bytes
+        self.skipped_records = 0
+        self.compactions = 0
+
+    @staticmethod
+    def _encode(device_id: str, entry: Dict[str, float]) -> str:
+        body = json.dumps([device_id, entry], separators=(",", ":"))
+        return f"{body}\t{zlib.crc32(body.encode('utf-8')):08x}\n"
+
+    @staticmethod
+    def _decode(line: str) -> Optional[Tuple[str, Dict[str, float]]]:
+        body, sep, crc = line.rstrip("\n").rpartition("\t")
+        if not sep or f"{zlib.crc32(body.encode('utf-8')):08x}" != crc:
+            return None
+        try:
+            device_id, entry = json.loads(body)
+        except (ValueError, TypeError):
+            return None
+        if not isinstance(device_id, str) or not isinstance(entry, dict):
+            return None
+        return device_id, entry
+
+    def load(self) -> Dict[str, Dict[str, float]]:
+        try:
+            state = _read_snapshot(self.path)
+        except Exception:
+            state = {}
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", errors="replace") as f:
+                for line in f:
+                    record = self._decode(line)
+                    if record is None:
+                        self.skipped_records += 1
+                        continue
+                    state[record[0]] = record[1]
+                    replayed += 1
+        if replayed or self.skipped_records:
+            # Start from a clean snapshot and an empty journal
+            self._compact(state)
+        return state
+
+    def save(self, state: Dict[str, Dict[str, float]], changed: Set[str]) -> None:
+        lines = "".join(self._encode(d, state[d]) for d in changed if d in state)
+        if lines:
+            created = not os.path.exists(self.journal_path)
+            with open(self.journal_path, "a") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            if created:
+                _fsync_dir(self.journal_path)
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) >= self.compact_bytes:
+            self._compact(state)
+
+    def _compact(self, state: Dict[str, Dict[str, float]]) -> None:
+        _write_snapshot(self.path, state)
+        # Snapshot is durable; the journal records it contains can go
+        with open(self.journal_path, "w") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.compactions += 1
+
+    def close(self, state: Dict[str, Dict[str, float]]) -> None:
+        """Fold the journal into the snapshot (clean shutdown)"""
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0:
+            self._compact(state)
+
+
 class EnergyTracker:
     """Tracks cumulative charge/discharge energy per device.
 
-    - update(device_id, power_w) integrates using wall-clock delta time
+    - update(device_id, power_w) integrates using wall-clock delta time;
+      update_many() does the same for several devices at once
     - maintains separate totals for energy_in_kwh (charging, power > 0)
       and energy_out_kwh (discharging, power < 0)
-    - persists state to JSON periodically (every update is fine at 30s cadence)
+    - updates only mark the state dirty; it is written (atomically, with
+      fsync) at most once per flush_interval seconds, and on flush()/exit
+    - storage "json" rewrites one snapshot file; "journal" appends only the
+      changed devices to a journal that is compacted into that snapshot
+    - integration is trapezoidal between the previous and current sample,
+      split at the zero crossing when power changes sign; within a run the
+      interval comes from the monotonic clock, and intervals longer than
+      max_gap seconds (restart, outage, open circuit) are discarded
     """
 
-    def __init__(self, storage_path: str | None = None) -> None:
+    MAX_GAP = 600.0
+
+    def __init__(self, storage_path: str | None = None, flush_interval: float = 60.0,
+                 storage: str = "json", max_gap: float = MAX_GAP) -> None:
         self._storage_path = self._resolve_storage_path(storage_path)
+        if storage == "journal":
+            self._storage = JournalStorage(self._storage_path)
+        else:
+            self._storage = SnapshotStorage(self._storage_path)
         self._state: Dict[str, Dict[str, float]] = {}
         self._lock = RLock()
+        self.flush_interval = max(0.0, float(flush_interval))
+        self._dirty: Set[str] = set()
+        self.max_gap = float(max_gap)
+        self.discarded_gaps = 0
+        # Monotonic time of each device's last sample in this process
+        self._last_mono: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self.writes = 0
         self._load()
+        # Last resort for a clean interpreter exit; shutdown paths call close() explicitly
+        atexit.register(self.close)
 
     def _resolve_storage_path(self, explicit: str | None) -> str:
         if explicit:
@@ -57,11 +221,7 @@ class EnergyTracker:
     def _load(self) -> None:
         with self._lock:
             try:
-                if os.path.exists(self._storage_path):
-                    with open(self._storage_path, "r") as f:
-                        data = json.load(f)
-                        if isinstance(data, dict):
-                            self._state = data
+                self._state = self._storage.load()
             except Exception:
                 # Start fresh on any load error
                 self._state = {}
@@ -69,14 +229,34 @@ class EnergyTracker:
     def _save(self) -> None:
         with self._lock:
             try:
-                tmp = self._storage_path + ".tmp"
-                with open(tmp, "w") as f:
-                    json.dump(self._state, f)
-                os.replace(tmp, self._storage_path)
+                self._storage.save(self._state, self._dirty)
+                self._dirty = set()
+                self.writes += 1
             except Exception:
                 # Ignore save errors to not break main loop
                 pass
 
+    def _mark_dirty(self, *device_ids: str) -> None:
+        self._dirty.update(device_ids)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write pending changes now (no-op when nothing changed)"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if self._dirty:
+                self._save()
+
+    def close(self) -> None:
+        """Flush and leave storage compact (shutdown)"""
+        with self._lock:
+            self.flush()
+            try:
+                self._storage.close(self._state)
+            except Exception:
+                pass
+
     def reset(self, device_id: str) -> None:
         with self._lock:
             self._state[device_id] = {
@@ -84,7 +264,8 @@ class EnergyTracker:
                 "energy_out_kwh": 0.0,
                 "last_ts": time.time(),
             }
-            self._save()
+            self._last_mono.pop(device_id, None)
+            self._mark_dirty(device_id)
 
     def _ensure_device(self, device_id: str) -> None:
         if device_id not in self._state:
@@ -95,29 +276,69 @@ class EnergyTracker:
 
         Returns a tuple (energy_in_kwh, energy_out_kwh) after the update.
         """
+        with self._lock:
+            result = self._integrate(device_id, power_w, now_ts)
+            self._mark_dirty(device_id)
+            return result
+
+    def update_many(self, powers: Mapping[str, float], now_ts: float | None = None) -> Dict[str, Tuple[float, float]]:
+        """Update several devices at one timestamp; returns {device_id: (in_kwh, out_kwh)}"""
+        with self._lock:
+            results = {device_id: self._integrate(device_id, power_w, now_ts)
+                       for device_id, power_w in powers.items()}
+            if results:
+                self._mark_dirty(*results)
+            return results
+
+    @staticmethod
+    def _trapezoid_kwh(p0: float, p1: float, dt: float) -> Tuple[float, float]:
+        """Energy (in_kwh, out_kwh) for power moving linearly from p0 to p1 over dt seconds.
+
+        When the sign flips inside the interval it is split at the zero
+        crossing, so charge and discharge are accounted separately.
+        """
+        if p0 * p1 < 0:
+            t_zero = dt * p0 / (p0 - p1)
+            areas = (p0 * t_zero / 2.0, p1 * (dt - t_zero) / 2.0)
+        else:
+            areas = ((p0 + p1) * dt / 2.0,)
+        # Ws -> kWh
+        e_in = sum(a for a in areas if a > 0) / 3.6e6
+        e_out = -sum(a for a in areas if a < 0) / 3.6e6
+        return e_in, e_out
+
+    def _integrate(self, device_id: str, power_w: float, now_ts: Optional[float]) -> Tuple[float, float]:
         with self._lock:
             self._ensure_device(device_id)
 
             entry = self._state[device_id]
-            last_ts = float(entry.get("last_ts", 0.0))
-            now = float(now_ts if now_ts is not None else time.time())
+            if not isinstance(power_w, (int, float)):
+                return float(entry.get("energy_in_kwh", 0.0)), float(entry.get("energy_out_kwh", 0.0))
+            power_w = float(power_w)
 
-            # Guard against non-monotonic clocks
-            dt = max(0.0, now - last_ts) if last_ts > 0 else 0.0
+            now = float(now_ts if now_ts is not None else time.time())
+            mono = time.monotonic() if now_ts is None else None
+            last_mono = self._last_mono.get(device_id)
+            if mono is not None and last_mono is not None:
+                # Same process: monotonic delta, immune to wall-clock steps
+                dt = mono - last_mono
+            else:
+                # First sample since start (or caller-supplied time): wall-clock delta
+                last_ts = float(entry.get("last_ts", 0.0))
+                dt = now - last_ts if last_ts > 0 else 0.0
 
-            # Integrate: W * s = Ws => Wh = Ws/3600 => kWh = Wh/1000
-            if dt > 0 and isinstance(power_w, (int, float)):
-                wh = (float(power_w) * dt) / 3600.0
-                kwh = wh / 1000.0
-                if kwh > 0:
-                    entry["energy_in_kwh"] = float(entry.get("energy_in_kwh", 0.0)) + kwh
-                elif kwh < 0:
-                    entry["energy_out_kwh"] = float(entry.get("energy_out_kwh", 0.0)) + abs(kwh)
+            last_power = entry.get("last_power_w")
+            if dt > self.max_gap:
+                # Power during the gap is unknown (restart, outage); do not guess
+                self.discarded_gaps += 1
+            elif dt > 0 and last_power is not None:
+                e_in, e_out = self._trapezoid_kwh(float(last_power), power_w, dt)
+                entry["energy_in_kwh"] = float(entry.get("energy_in_kwh", 0.0)) + e_in
+                entry["energy_out_kwh"] = float(entry.get("energy_out_kwh", 0.0)) + e_out
 
             entry["last_ts"] = now
-
-            # Persist on every update (30s cadence by default)
-            self._save()
+            entry["last_power_w"] = power_w
+            if mono is not None:
+                self._last_mono[device_id] = mono
 
             return float(entry.get("energy_in_kwh", 0.0)), float(entry.get("energy_out_kwh", 0.0))
-
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Per-battery health state machine (circuit breaker).
+
+A pack that stops answering is not polled every cycle forever: after a few
+consecutive failures its circuit opens and it is only probed with
+exponentially growing pauses until it answers again.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATES = (HEALTHY, DEGRADED, OPEN, HALF_OPEN)
+
+
+class BatteryHealth:
+    """Health of one battery.
+
+    - healthy: reads succeed
+    - degraded: the last read(s) failed, still polled every cycle
+    - open: OPEN_AFTER consecutive failures; not polled until the probe time
+    - half_open: one probe read is allowed; success closes the circuit
+      (healthy), failure reopens it with a doubled backoff (up to MAX_BACKOFF)
+
+    record_success()/record_failure() return (old, new) on a state change and
+    None otherwise, so callers can log and publish once per transition.
+    """
+
+    OPEN_AFTER = 3
+    BASE_BACKOFF = 60.0
+    MAX_BACKOFF = 900.0
+
+    def __init__(
+        self,
+        open_after: int = OPEN_AFTER,
+        base_backoff: float = BASE_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+        clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.open_after = max(1, int(open_after))
+        self.base_backoff = float(base_backoff)
+        self.max_backoff = max(float(max_backoff), self.base_backoff)
+        self._clock = clock
+
+        self.state = HEALTHY
+        self.consecutive_failures = 0
+        self.backoff = 0.0
+        self.next_probe: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.transitions = 0
+
+    def _set(self, state: str) -> Optional[Tuple[str, str]]:
+        if state == self.state:
+            return None
+        old, self.state = self.state, state
+        self.transitions += 1
+        return old, state
+
+    @property
+    def available(self) -> bool:
+        """Whether the battery's readings should be shown as live.
+
+        A single failed read (degraded) keeps the battery available so one
+        bad frame does not flap the entities; an open circuit does not.
+        """
+        return self.state in (HEALTHY, DEGRADED)
+
+    def should_poll(self) -> bool:
+        """True when the battery should be read this cycle.
+
+        An open circuit whose probe time has come moves to half_open and
+        allows exactly one read.
+        """
+        if self.state != OPEN:
+            return True
+        if self._clock() < self.next_probe:
+            return False
+        self._set(HALF_OPEN)
+        return True
+
+    def record_success(self) -> Optional[Tuple[str, str]]:
+        self.consecutive_failures = 0
+        self.backoff = 0.0
+        self.next_probe = None
+        self.last_error = None
+        return self._set(HEALTHY)
+
+    def record_failure(self, error: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        self.consecutive_failures += 1
+        self.last_error = error
+
+        if self.state == HALF_OPEN:
+            # Probe failed: back off further
+            return self._open(min(self.max_backoff, self.backoff * 2))
+        if self.consecutive_failures >= self.open_after:
+            return self._open(self.base_backoff)
+        return self._set(DEGRADED)
+
+    def _open(self, backoff: float) -> Optional[Tuple[str, str]]:
+        self.backoff = backoff
+        self.next_probe = self._clock() + backoff
+        return self._set(OPEN)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """State summary for MQTT/diagnostics"""
+        probe_in = None
+        if self.state == OPEN and self.next_probe is not None:
+            probe_in = round(max(0.0, self.next_probe - self._clock()), 1)
+        return {
+            'state': self.state,
+            'available': self.available,
+            'consecutive_failures': self.consecutive_failures,
+            'backoff_s': self.backoff,
+            'next_probe_in_s': probe_in,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Background hot-plug discovery.
+
+While monitoring runs, a low-priority thread probes the unused addresses of
+the buses in use for new packs. A probe only starts in an idle gap: no cycle
+is polling, the next scheduled tick is far enough away for the probe to
+finish, and the bus is free. Packs it finds are handed to the monitoring loop,
+which attaches them to the manager between cycles.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from addon_config import BatteryConfig
+from bms_parser import BMSParser
+from modbus import request_device_info
+
+
+logger = logging.getLogger(__name__)
+
+
+class HotplugScanner:
+    """Probes unused addresses in the idle time between scheduled reads.
+
+    - a probe needs timeout + GUARD seconds before scheduler.next_tick, no
+      cycle in progress (manager.polling) and a free bus lock, so it never
+      delays a scheduled read
+    - addresses are probed one at a time with PROBE_PAUSE in between; after a
+      full sweep of every bus the scanner rests for interval seconds
+    - take_found() returns the packs found since the last call as read-only
+      BatteryConfig entries (Service 42, the bus's baud rate); their address
+      stays claimed (not probed) until release() once the caller attached
+      them, so a pack removed later is found again when it comes back
+    """
+
+    GUARD = 1.0
+    PROBE_PAUSE = 0.5
+    IDLE_POLL = 0.2
+
+    def __init__(
+        self,
+        manager,
+        scheduler,
+        address_from: int = 1,
+        address_to: int = 16,
+        timeout: float = 0.3,
+        interval: float = 300.0
+    ) -> None:
+        self.manager = manager
+        self.scheduler = scheduler
+        self.address_from = int(address_from)
+        self.address_to = int(address_to)
+        self.timeout = float(timeout)
+        self.interval = float(interval)
+
+        self._found: List[BatteryConfig] = []
+        self._claimed: Set[Tuple[str, int]] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {'sweeps': 0, 'probes': 0, 'found': 0}
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="bms-hotplug", daemon=True)
+        self._thread.start()
+        logger.info(f"🔌 Hot-plug scanner started (addresses {self.address_from}..{self.address_to}, "
+                    f"sweep every {self.interval:g}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 2.0)
+            self._thread = None
+
+    def take_found(self) -> List[BatteryConfig]:
+        """Packs found since the last call"""
+        with self._lock:
+            found, self._found = self._found, []
+        return found
+
+    def release(self, battery: BatteryConfig) -> None:
+        """Drop the claim on a found pack's address (after attaching it or giving up)"""
+        with self._lock:
+            self._claimed.discard((self.manager.port_manager.bus_key(battery.port), battery.address))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._sweep()
+                self.stats['sweeps'] += 1
+            except Exception as e:
+                logger.debug(f"Hot-plug sweep failed: {e}")
+            self._stop.wait(self.interval)
+
+    def _buses(self) -> Dict[str, Tuple[str, int, Set[int]]]:
+        """Bus key -> (port path, baud rate, addresses in use)"""
+        buses: Dict[str, Tuple[str, int, Set[int]]] = {}
+        for bus, batteries in self.manager.group_by_bus(list(self.manager.batteries)).items():
+            first = batteries[0]
+            buses[bus] = (first.port, first.baudrate, {b.address for b in batteries})
+        return buses
+
+    def _sweep(self) -> None:
+        for bus, (port, baudrate, used) in self._buses().items():
+            for address in range(self.address_from, self.address_to + 1):
+                with self._lock:
+                    claimed = (bus, address) in self._claimed
+                if address in used or claimed:
+                    continue
+                if not self._probe_when_idle(bus, port, address, baudrate):
+                    return
+                self._stop.wait(self.PROBE_PAUSE)
+
+    def _idle_for_probe(self) -> bool:
+        """Whether a probe started now finishes before the next scheduled read"""
+        if self.manager.polling:
+            return False
+        next_tick = self.scheduler.next_tick
+        if next_tick is None:
+            return False
+        return next_tick - time.monotonic() >= self.timeout + self.GUARD
+
+    def _probe_when_idle(self, bus: str, port: str, address: int, baudrate: int) -> bool:
+        """Wait for an idle gap and probe address; False when stopping"""
+        bus_lock = self.manager.port_manager.bus_lock(port)
+        while not self._stop.is_set():
+            if self._idle_for_probe() and bus_lock.acquire(blocking=False):
+                try:
+                    # Re-check under the lock: a cycle may have started meanwhile
+                    if self._idle_for_probe():
+                        self._probe(bus, port, address, baudrate)
+                        return True
+                finally:
+                    bus_lock.release()
+            self._stop.wait(self.IDLE_POLL)
+        return False
+
+    def _probe(self, bus: str, port: str, address: int, baudrate: int) -> None:
+        self.stats['probes'] += 1
+        try:
+            raw = request_device_info(
+                port=port,
+                address=address,
+                baudrate=baudrate,
+                timeout=self.timeout,
+                port_manager=self.manager.port_manager,
+            )
+            if not raw or len(raw) < 3:
+                return
+            frame = BMSParser.parse_frame(raw)
+        except Exception:
+            return
+
+        battery = BatteryConfig(port, address, f"Battery_{address}", True, baudrate)
+        battery.freeze()
+        with self._lock:
+            self._claimed.add((bus, address))
+            self._found.append(battery)
+        self.stats['found'] += 1
+        logger.info(f"🆕 Hot-plug: pack answered on {port} address {address} "
+                    f"({frame.cell_count} cells, SOC {frame.soc_percent}%)")
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Per-battery response latency tracking and adaptive timeouts.
+
+A pack that answers within ~100 ms does not need a 2 s timeout: once enough
+round trips have been observed, the timeout is derived from the observed
+p99 latency, so a silent (unplugged, powered off) pack costs tens of
+milliseconds instead of the full configured timeout.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+
+class _LatencySeries:
+    """EWMA plus a sliding window of samples for percentiles"""
+
+    def __init__(self, window: int, alpha: float) -> None:
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.ewma = seconds if self.ewma is None else self.ewma + self.alpha * (seconds - self.ewma)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(p * len(ordered)) - 1))
+        return ordered[index]
+
+
+class LatencyStats:
+    """Latency statistics and adaptive timeouts for one battery.
+
+    - first_byte: time from request to the first response byte
+    - total: time from request to the terminating CR
+    - timeouts() returns (timeout, first_byte_timeout) as p99 * factor clamped
+      to [floor, configured timeout]; until MIN_SAMPLES responses were seen
+      the configured timeout is used unchanged
+    - every RELEARN_EVERY consecutive misses one attempt runs with the full
+      configured timeout, so a pack that became slower is not locked out
+    """
+
+    MIN_SAMPLES = 5
+    FACTOR = 3.0
+    FIRST_BYTE_FLOOR = 0.05
+    TOTAL_FLOOR = 0.15
+    RELEARN_EVERY = 10
+
+    def __init__(self, window: int = 100, alpha: float = 0.2) -> None:
+        self.first_byte = _LatencySeries(window, alpha)
+        self.total = _LatencySeries(window, alpha)
+        self.consecutive_misses = 0
+
+    def record_success(self, first_byte: Optional[float], total: Optional[float]) -> None:
+        if first_byte is not None:
+            self.first_byte.record(first_byte)
+        if total is not None:
+            self.total.record(total)
+        self.consecutive_misses = 0
+
+    def record_miss(self) -> None:
+        self.consecutive_misses += 1
+
+    @property
+    def warm(self) -> bool:
+        """Enough responses seen to derive timeouts"""
+        return len(self.total.samples) >= self.MIN_SAMPLES
+
+    def timeouts(self, configured: float, fallback: Optional["LatencyStats"] = None) -> Tuple[float, Optional[float]]:
+        """(timeout, first_byte_timeout) for the next request.
+
+        fallback (e.g. the bus-wide stats) is used while this series has not
+        seen enough responses, so a pack that never answered is not probed
+        with the full configured timeout every cycle.
+        """
+        if self.consecutive_misses and self.consecutive_misses % self.RELEARN_EVERY == 0:
+            return configured, None
+        source = self if self.warm else fallback
+        if source is None or not source.warm:
+            return configured, None
+
+        timeout = min(configured, max(self.TOTAL_FLOOR, source.total.percentile(0.99) * self.FACTOR))
+
+        first_byte_timeout = None
+        fb_p99 = source.first_byte.percentile(0.99)
+        if fb_p99 is not None:
+            first_byte_timeout = min(timeout, max(self.FIRST_BYTE_FLOOR, fb_p99 * self.FACTOR))
+        return timeout, first_byte_timeout
+
+    def as_dict(self, configured: float, fallback: Optional["LatencyStats"] = None) -> Dict[str, Optional[float]]:
+        """Latency summary in milliseconds"""
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * 1000.0, 1)
+
+        timeout, first_byte_timeout = self.timeouts(configured, fallback)
+        return {
+            'samples': len(self.total.samples),
+            'ewma_ms': ms(self.total.ewma),
+            'p50_ms': ms(self.total.percentile(0.5)),
+            'p99_ms': ms(self.total.percentile(0.99)),
+            'first_byte_p99_ms': ms(self.first_byte.percentile(0.99)),
+            'timeout_ms': ms(timeout),
+            'first_byte_timeout_ms': ms(first_byte_timeout),
+            'consecutive_misses': self.consecutive_misses,
+        }
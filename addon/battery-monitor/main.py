@@ -6,12 +6,18 @@ Multi-battery support with virtual battery aggregation
 
 import sys
 import time
+import asyncio
 import logging
+import signal
 
 from multi_battery import MultiBatteryManager
 from mqtt_helper import MultiBatteryMQTTPublisher
-from addon_config import get_config
+from publish_queue import PublishQueue
+from addon_config import get_config, OptionsWatcher
 from discovery import run_discovery
+from async_engine import AsyncBatteryReader, AsyncMQTTPublisher
+from scheduler import FixedRateScheduler
+from hotplug import HotplugScanner
 
 
 def setup_logging(level: str = "INFO"):
@@ -41,8 +47,207 @@ def set_log_level(level: str) -> None:
     logging.info(f"📣 Log level set to {logging.getLevelName(desired)}")
 
 
+def log_cycle_data(all_data) -> None:
+    """Summary output for each battery of one reading cycle"""
+    for battery_name, data in all_data.items():
+        if battery_name == "_virtual_battery":
+            logging.info(f"🏦 Virtual Battery: "
+                       f"SOC {data.get('soc_percent', 0):.1f}%, "
+                       f"Voltage {data.get('pack_voltage_v', 0):.2f}V, "
+                       f"Current {data.get('pack_current_a', 0):.2f}A, "
+                       f"Batteries: {data.get('battery_count', 0)}")
+        else:
+            logging.info(f"🔋 {battery_name}: "
+                       f"SOC {data.get('soc_percent', 0):.1f}%, "
+                       f"Voltage {data.get('pack_voltage_v', 0):.2f}V, "
+                       f"Current {data.get('pack_current_a', 0):.2f}A")
+
+
+def log_scheduler_stats(scheduler: FixedRateScheduler, lateness: float) -> None:
+    """Per-cycle scheduling metrics"""
+    stats = scheduler.get_stats()
+    logging.debug(f"⏱️ Tick lateness: {lateness * 1000:.1f} ms "
+                  f"(max {stats['max_lateness_s'] * 1000:.1f} ms, "
+                  f"overruns: {stats['overruns']}, missed ticks: {stats['missed_ticks']})")
+
+
+def make_publish_queue(config, publisher) -> PublishQueue:
+    """Publish queue so reading cycles never wait for MQTT"""
+    return PublishQueue(
+        publisher,
+        maxsize=config.publish_queue_size,
+        spill=config.publish_spill
+    )
+
+
+def start_publish_queue(config, publisher) -> PublishQueue:
+    """Publish queue drained by a background thread"""
+    queue = make_publish_queue(config, publisher)
+    queue.start()
+    return queue
+
+
+def publish_state_changes(battery_manager, publisher) -> None:
+    """Publish battery health and availability that changed since the last successful publish"""
+    if publisher.take_reconnected():
+        # The broker may have lost retained messages; send everything again
+        battery_manager.forget_published_state()
+    changes = battery_manager.health_changes()
+    if changes and publisher.publish_battery_health(changes):
+        battery_manager.clear_health_changes(changes)
+    availability = battery_manager.availability_changes()
+    if availability and publisher.publish_battery_availability(availability):
+        battery_manager.mark_availability_published(availability)
+
+
+def start_hotplug_scanner(config, battery_manager, scheduler) -> HotplugScanner:
+    """Low-priority scanner probing unused addresses between scheduled reads"""
+    scanner = HotplugScanner(
+        battery_manager,
+        scheduler,
+        address_from=config.discovery_address_from,
+        address_to=config.discovery_address_to,
+        timeout=max(0.05, config.discovery_timeout_ms / 1000.0),
+        interval=config.hotplug_interval
+    )
+    scanner.start()
+    return scanner
+
+
+def attach_hotplugged(scanner, battery_manager, mqtt) -> None:
+    """Attach packs found by the hot-plug scanner and publish their discovery"""
+    attached = []
+    for battery in scanner.take_found():
+        name, suffix = battery.name, 1
+        names = {b.name for b in battery_manager.batteries}
+        while name in names:
+            suffix += 1
+            name = f"{battery.name}_{suffix}"
+        if name != battery.name:
+            battery = battery.with_name(name)
+        if battery_manager.add_battery(battery):
+            attached.append(battery)
+        # Now in use (or refused); a later removal makes the address free to probe again
+        scanner.release(battery)
+    if not attached:
+        return
+    logging.info(f"🆕 Attached {len(attached)} hot-plugged battery(ies): {', '.join(b.name for b in attached)}. "
+                 f"Add them to the batteries option to keep them after a restart.")
+    if mqtt:
+        # Sent by the publish worker: this thread must not wait for the broker
+        mqtt.request_discovery([b.name for b in battery_manager.batteries if b.enabled])
+
+
+def apply_config_changes(watcher, battery_manager, publisher) -> None:
+    """Reload options.json if it changed and apply the battery diff without a restart"""
+    try:
+        diff = watcher.poll()
+    except Exception as e:
+        logging.error(f"❌ Failed to reload configuration: {e}")
+        return
+    if not diff:
+        return
+    logging.info(f"🔧 Configuration reloaded: {diff.summary()}")
+    removed = battery_manager.apply_config_diff(diff)
+    live = set(publisher.LIVE_SETTINGS) if publisher is not None else set()
+    restart = [name for name in diff.settings if name not in live]
+    if restart:
+        logging.warning(f"⚠️ Restart the add-on to apply: {', '.join(restart)}")
+    if publisher is None:
+        return
+    try:
+        if diff.settings:
+            publisher.apply_config(diff.config)
+        if removed:
+            publisher.publish_battery_availability({name: False for name in removed})
+        if diff.added or diff.changed or live.intersection(diff.settings):
+            publisher.request_discovery([b.name for b in battery_manager.batteries if b.enabled])
+    except Exception as e:
+        logging.warning(f"⚠️ Error publishing configuration changes: {e}")
+
+
+async def run_async_monitoring(config, battery_manager, enabled_batteries) -> int:
+    """Monitoring loop on the asyncio engine (serial, parsing and MQTT on one event loop)"""
+    reader = AsyncBatteryReader(battery_manager)
+    mqtt = None
+    mqtt_connected = False
+
+    try:
+        logging.info("📡 ======== MQTT INITIALIZATION ========")
+        mqtt = AsyncMQTTPublisher()
+        mqtt_connected = await mqtt.connect(timeout=15, retries=3)
+        if mqtt_connected:
+            battery_names = [bat.name for bat in enabled_batteries]
+            logging.info(f"📤 Publishing Auto Discovery for {len(battery_names)} batteries...")
+            await mqtt.publish_multi_battery_discovery(battery_names)
+        else:
+            logging.warning("⚠️ MQTT connection failed - application will continue without MQTT")
+    except Exception as e:
+        logging.error(f"❌ MQTT initialization failed: {e}")
+        logging.warning("⚠️ Application will continue without MQTT")
+
+    # Drained by a task on this loop; the async publisher is the sink
+    queue = make_publish_queue(config, mqtt.publisher) if mqtt is not None else None
+    queue_task = asyncio.create_task(queue.run_async(mqtt)) if queue is not None else None
+
+    logging.info(f"🔄 Starting async monitoring loop (interval: {config.read_interval}s)")
+    if config.hotplug_scan:
+        # The async transport keeps its own serial handles; probing them from a thread would collide
+        logging.warning("⚠️ hotplug_scan is not supported with async_engine; background scanning disabled")
+
+    scheduler = FixedRateScheduler(config.read_interval)
+    scheduler.start()
+    watcher = OptionsWatcher() if config.watch_options else None
+    cycle_count = 0
+    try:
+        while True:
+            try:
+                cycle_count += 1
+                logging.info(f"📊 Cycle #{cycle_count}")
+
+                all_data = await reader.get_all_data()
+                if all_data:
+                    logging.info(f"✅ Data loaded from {len(all_data)} batteries!")
+                    log_cycle_data(all_data)
+
+                    if queue is not None:
+                        queue.submit(all_data)
+                else:
+                    logging.warning("❌ No data loaded from batteries")
+
+                # Publishing blocks (paho, reconnect waits); keep it off the loop
+                if mqtt is not None:
+                    await mqtt.run(publish_state_changes, battery_manager, mqtt.publisher)
+
+                if watcher is not None:
+                    if mqtt is not None:
+                        await mqtt.run(apply_config_changes, watcher, battery_manager, mqtt.publisher)
+                    else:
+                        apply_config_changes(watcher, battery_manager, None)
+            except Exception as e:
+                logging.error(f"Error in monitoring loop: {e}")
+
+            # Sleep until the next absolute tick so read time does not add to the period
+            lateness = await scheduler.wait_async()
+            log_scheduler_stats(scheduler, lateness)
+    finally:
+        if queue is not None:
+            await queue.stop_async()
+            queue_task.cancel()
+        if mqtt:
+            mqtt.disconnect()
+        reader.transport.close_all()
+        battery_manager.close()
+
+
+def _handle_sigterm(signum, frame):
+    """Supervisor stop (SIGTERM): unwind like Ctrl+C so shutdown cleanup runs"""
+    raise KeyboardInterrupt
+
+
 def main():
     """Main function with enhanced multi-battery support and logging"""
+    signal.signal(signal.SIGTERM, _handle_sigterm)
     # Ensure we see early logs before config is loaded
     setup_logging("INFO")
     logging.info("🔋 Battery Monitor Add-on - Multi-Battery Version 1.1.9")
@@ -77,6 +282,7 @@ def main():
         logging.info(f"   📛 Virtual battery name: '{config.virtual_battery_name}'")
     logging.info(f"   📡 MQTT Host: {config.mqtt_host}:{config.mqtt_port}")
     logging.info(f"   ⏱️  Read Interval: {config.read_interval}s")
+    logging.info(f"   ⚡ Async engine: {'✅ ENABLED' if config.async_engine else '❌ DISABLED'}")
     logging.info("🔧 =======================================")
 
     # One-off discovery mode
@@ -87,6 +293,10 @@ def main():
             'discovery_address_from': config.discovery_address_from,
             'discovery_address_to': config.discovery_address_to,
             'discovery_timeout_ms': config.discovery_timeout_ms,
+            'discovery_max_misses': config.discovery_max_misses,
+            'discovery_baudrates': config.discovery_baudrates,
+            'discovery_protocols': config.discovery_protocols,
+            'discovery_incremental': config.discovery_incremental,
         })
         logging.info(f"🔎 Discovery finished. Found: {summary.get('count', 0)} devices.")
         logging.info("📝 Copy batteries:[] block from /data/discovered_batteries.yaml into add-on options.")
@@ -104,6 +314,15 @@ def main():
         logging.error(f"❌ Failed to initialize battery manager: {e}")
         return 1
     
+    # Asyncio engine: one event loop drives serial I/O and MQTT publishing
+    if getattr(config, 'async_engine', False):
+        logging.info("⚡ Using asyncio engine")
+        try:
+            return asyncio.run(run_async_monitoring(config, battery_manager, enabled_batteries))
+        except KeyboardInterrupt:
+            logging.info("🛑 Monitoring stopped by user")
+            return 0
+
     # Initialize MQTT with enhanced logging
     mqtt = None
     mqtt_connected = False
@@ -142,9 +361,16 @@ def main():
         logging.error(f"❌ MQTT initialization failed: {e}")
         logging.warning("⚠️ Application will continue without MQTT")
     
+    # Readings are handed to a background publisher; outages are buffered, not waited out
+    queue = start_publish_queue(config, mqtt) if mqtt else None
+
     # Main monitoring loop
     logging.info(f"🔄 Starting monitoring loop (interval: {config.read_interval}s)")
     
+    scheduler = FixedRateScheduler(config.read_interval)
+    scheduler.start()
+    scanner = start_hotplug_scanner(config, battery_manager, scheduler) if config.hotplug_scan else None
+    watcher = OptionsWatcher() if config.watch_options else None
     cycle_count = 0
     while True:
         try:
@@ -159,51 +385,53 @@ def main():
                 logging.info(f"✅ Data loaded from {len(all_data)} batteries!")
                 
                 # Summary output for each battery
-                for battery_name, data in all_data.items():
-                    if battery_name == "_virtual_battery":
-                        logging.info(f"🏦 Virtual Battery: "
-                                   f"SOC {data.get('soc_percent', 0):.1f}%, "
-                                   f"Voltage {data.get('pack_voltage_v', 0):.2f}V, "
-                                   f"Current {data.get('pack_current_a', 0):.2f}A, "
-                                   f"Batteries: {data.get('battery_count', 0)}")
-                    else:
-                        logging.info(f"🔋 {battery_name}: "
-                                   f"SOC {data.get('soc_percent', 0):.1f}%, "
-                                   f"Voltage {data.get('pack_voltage_v', 0):.2f}V, "
-                                   f"Current {data.get('pack_current_a', 0):.2f}A")
+                log_cycle_data(all_data)
                 
-                # Publishing to MQTT (only if connected)
-                if mqtt_connected and mqtt:
-                    try:
-                        if mqtt.publish_all_battery_data(all_data):
-                            logging.info("📤 Data from all batteries published to MQTT")
-                        else:
-                            logging.warning("⚠️ Failed to publish to MQTT")
-                            # Attempt to restore connection
-                            if not mqtt.connected:
-                                logging.info("🔄 Attempting to restore MQTT connection...")
-                                mqtt_connected = mqtt.ensure_connected(timeout=10)
-                    except Exception as e:
-                        logging.error(f"❌ Error during MQTT publishing: {e}")
+                # Queue for MQTT; the background publisher sends it once connected
+                if queue is not None:
+                    queue.submit(all_data)
+                    if not mqtt.connected:
+                        logging.info(f"📊 Data buffered (MQTT unavailable, {queue.pending()} pending)")
                 else:
                     logging.info("📊 Data read (MQTT unavailable)")
                 
             else:
                 logging.warning("❌ No data loaded from batteries")
-            
-            # Wait for next iteration
-            time.sleep(config.read_interval)
+
+            # Health and availability are published on change only (retained)
+            if mqtt:
+                publish_state_changes(battery_manager, mqtt)
+
+            # New packs join between cycles, so the next cycle polls them
+            if scanner is not None:
+                attach_hotplugged(scanner, battery_manager, mqtt)
+
+            # Battery changes in options.json apply between cycles
+            if watcher is not None:
+                apply_config_changes(watcher, battery_manager, mqtt)
             
         except KeyboardInterrupt:
             logging.info("🛑 Monitoring stopped by user")
             break
         except Exception as e:
             logging.error(f"Error in monitoring loop: {e}")
-            time.sleep(10)  # Wait before retry
+
+        # Wait for the next absolute tick; read/publish time does not add to the period
+        try:
+            lateness = scheduler.wait()
+            log_scheduler_stats(scheduler, lateness)
+        except KeyboardInterrupt:
+            logging.info("🛑 Monitoring stopped by user")
+            break
     
     # Cleanup
+    if scanner is not None:
+        scanner.stop()
+    if queue is not None:
+        queue.stop()
     if mqtt:
         mqtt.disconnect()
+    battery_manager.close()
     
     return 0
 
@@ -4,10 +4,13 @@
 Enhanced MQTT Helper for Multi-Battery Home Assistant Auto Discovery
 """
 
+import hashlib
 import json
 import logging
+import os
+import threading
 import time
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Set, Tuple
 import paho.mqtt.client as mqtt
 
 from addon_config import get_config
@@ -15,21 +18,178 @@ from addon_config import get_config
 
 logger = logging.getLogger(__name__)
 
+# Home Assistant birth/last-will topic ("online" after HA (re)starts)
+HA_STATUS_TOPIC = "homeassistant/status"
+
+DISCOVERY_CACHE_PATHS = [
+    "/data/mqtt_discovery_cache.json",  # HA Add-on persistent storage
+    os.path.join(os.getcwd(), "mqtt_discovery_cache.json"),  # fallback for dev
+]
+
+
+def _resolve_cache_path() -> str:
+    for path in DISCOVERY_CACHE_PATHS:
+        base_dir = os.path.dirname(path) or "."
+        if os.path.exists(path) or os.access(base_dir, os.W_OK):
+            return path
+    return DISCOVERY_CACHE_PATHS[-1]
+
+
+# Topic classes with their own QoS
+TOPIC_CLASSES = ("discovery", "state", "availability")
+
+
+class DeliveryTracker:
+    """In-flight message IDs and publish-to-ack latency per topic class.
+
+    A message is in flight from client.publish() until on_publish reports its
+    mid (written to the socket for QoS 0, PUBACK for QoS 1, PUBCOMP for QoS 2).
+    QoS 1/2 messages published while disconnected are queued by paho and
+    count as in flight too (queued_offline) until they are acked.
+    acquire() bounds the number of messages in flight; waiting for a free
+    slot is what shows broker backpressure.
+    """
+
+    # Latency histogram bucket upper bounds in milliseconds (last bucket: above)
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self, max_in_flight: int = 100) -> None:
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._cond = threading.Condition()
+        self._in_flight: Dict[int, Tuple[float, str]] = {}
+        self._early_acks = set()
+        self.histograms = {c: [0] * (len(self.BUCKETS_MS) + 1) for c in TOPIC_CLASSES}
+        self.stats = {'published': 0, 'acked': 0, 'failed': 0, 'lost': 0, 'queued_offline': 0,
+                      'window_waits': 0, 'window_timeouts': 0, 'max_in_flight_seen': 0}
+
+    def acquire(self, timeout: Optional[float]) -> bool:
+        """Wait for a free in-flight slot (timeout None: do not wait)"""
+        with self._cond:
+            if len(self._in_flight) < self.max_in_flight:
+                return True
+            if timeout is None:
+                self.stats['window_timeouts'] += 1
+                return False
+            self.stats['window_waits'] += 1
+            if self._cond.wait_for(lambda: len(self._in_flight) < self.max_in_flight, timeout):
+                return True
+            self.stats['window_timeouts'] += 1
+            return False
+
+    def sent(self, mid: int, topic_class: str, started: float, offline: bool = False) -> None:
+        with self._cond:
+            self.stats['published'] += 1
+            if offline:
+                self.stats['queued_offline'] += 1
+            if mid in self._early_acks:
+                # on_publish ran before publish() returned
+                self._early_acks.discard(mid)
+                self._record(topic_class, time.monotonic() - started)
+                return
+            self._in_flight[mid] = (started, topic_class)
+            self.stats['max_in_flight_seen'] = max(self.stats['max_in_flight_seen'], len(self._in_flight))
+
+    def failed(self) -> None:
+        with self._cond:
+            self.stats['failed'] += 1
+
+    def acked(self, mid: int) -> None:
+        with self._cond:
+            entry = self._in_flight.pop(mid, None)
+            if entry is None:
+                self._early_acks.add(mid)
+                return
+            started, topic_class = entry
+            self._record(topic_class, time.monotonic() - started)
+            self._cond.notify_all()
+
+    def _record(self, topic_class: str, seconds: float) -> None:
+        self.stats['acked'] += 1
+        ms = seconds * 1000.0
+        histogram = self.histograms[topic_class]
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms <= bound:
+                histogram[i] += 1
+                return
+        histogram[-1] += 1
+
+    def connection_lost(self, qos_by_class: Dict[str, int]) -> None:
+        """QoS 0 messages still in flight are gone; QoS 1/2 are retried by paho"""
+        with self._cond:
+            for mid, (_, topic_class) in list(self._in_flight.items()):
+                if qos_by_class.get(topic_class, 0) == 0:
+                    del self._in_flight[mid]
+                    self.stats['lost'] += 1
+            self._early_acks.clear()
+            self._cond.notify_all()
+
+    def in_flight(self) -> int:
+        with self._cond:
+            return len(self._in_flight)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Counters plus latency histograms ({"<=5ms": n, ..., ">5000ms": n})"""
+        labels = [f"<={b}ms" for b in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        with self._cond:
+            return dict(
+                self.stats,
+                in_flight=len(self._in_flight),
+                latency={c: dict(zip(labels, h)) for c, h in self.histograms.items() if any(h)}
+            )
+
 
 class MultiBatteryMQTTPublisher:
     """Enhanced MQTT publisher for multi-battery Home Assistant integration"""
+
+    # Options apply_config() takes over from a reloaded config; the rest (broker
+    # connection, topic names) keep their startup values until a restart
+    LIVE_SETTINGS = ('mqtt_json_state', 'publish_on_change', 'heartbeat_interval', 'mqtt_qos_discovery',
+                     'mqtt_qos_state', 'mqtt_qos_availability', 'manufacturer', 'model', 'virtual_battery_name')
     
     def __init__(self):
         self.config = get_config()
+        # Broker connection and topic names always come from the startup snapshot
+        self.connection_config = self.config
         self.client = mqtt.Client()
-        if self.config.mqtt_username:
-            self.client.username_pw_set(self.config.mqtt_username, self.config.mqtt_password)
+        if self.connection_config.mqtt_username:
+            self.client.username_pw_set(self.connection_config.mqtt_username, self.connection_config.mqtt_password)
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_publish = self._on_publish
+        self.client.on_message = self._on_message
         self.connected = False
         self._loop_running = False
+        # Set on every (re)connect until the monitoring loop has republished retained state
+        self._reconnected = False
+        # Requests from paho's network thread, carried out by the publishing thread:
+        # resend every value (reconnect) and republish discovery (HA birth)
+        self._resend_state = False
+        self._ha_restarted = False
+        # Discovery requested by a thread that must not wait for the broker (request_discovery)
+        self._discovery_requested = False
+        # Guards discovery hashes and last published values (main thread and publish worker)
+        self._state_lock = threading.RLock()
+        # Publishing options (JSON state, publish-on-change, QoS); refreshed by apply_config()
+        self._load_publish_settings()
+        # Publish-on-change: last published value and time per topic/field
+        self._last_published: Dict[str, Tuple[Any, float]] = {}
+        self.publish_stats = {'sent': 0, 'suppressed': 0}
+        # Discovery: content hash per retained config topic (persisted), sensor lists per device kind
+        self._discovery_cache_path = _resolve_cache_path()
+        self._discovery_hashes: Dict[str, str] = self._load_discovery_cache()
+        self._discovery_batteries: List[str] = []
+        self._sensor_definitions: Dict[bool, List[Dict]] = {}
+        # Delivery tracking (in-flight window, ack latency)
+        self.delivery = DeliveryTracker(getattr(self.config, 'mqtt_max_in_flight', 100))
+        self.publish_window_timeout = 5.0
+        # Threads that may wait for a free in-flight slot (publish workers); every
+        # other caller (polling thread, event loop, paho callbacks) fails fast
+        self._window_waiters: Set[int] = set()
         self._last_reconnect_attempt = 0.0
+        try:
+            self.client.max_inflight_messages_set(self.delivery.max_in_flight)
+        except Exception:
+            pass
 
         # Configure exponential backoff for reconnects when supported
         try:
@@ -38,20 +198,54 @@ class MultiBatteryMQTTPublisher:
             pass
 
         # Availability topic and Last Will (LWT)
-        self._availability_topic = f"bms/{self.config.device_id}/availability"
+        self._availability_topic = f"bms/{self.connection_config.device_id}/availability"
         try:
-            self.client.will_set(self._availability_topic, payload="offline", qos=1, retain=True)
+            self.client.will_set(self._availability_topic, payload="offline", qos=self.qos['availability'], retain=True)
         except Exception:
             logger.debug("LWT setup failed (will_set)")
         
+    def _load_publish_settings(self) -> None:
+        # Publish one JSON payload per device instead of one message per sensor
+        self.json_state = bool(getattr(self.config, 'mqtt_json_state', False))
+        self.publish_on_change = bool(getattr(self.config, 'publish_on_change', True))
+        self.heartbeat_interval = float(getattr(self.config, 'heartbeat_interval', 300))
+        # QoS per topic class
+        self.qos = {
+            'discovery': int(getattr(self.config, 'mqtt_qos_discovery', 1)),
+            'state': int(getattr(self.config, 'mqtt_qos_state', 0)),
+            'availability': int(getattr(self.config, 'mqtt_qos_availability', 1)),
+        }
+
+    def apply_config(self, config) -> None:
+        """Switch to a reloaded config snapshot.
+
+        LIVE_SETTINGS apply from the next publish, with every value sent
+        again; the caller republishes discovery for the new names and state
+        format.
+        """
+        with self._state_lock:
+            self.config = config
+            self._load_publish_settings()
+            self._resend_state = True
+
     def _on_connect(self, client, userdata, flags, rc):
         """Callback for MQTT connection"""
         if rc == 0:
             self.connected = True
-            logger.info(f"✅ Connected to MQTT broker {self.config.mqtt_host}:{self.config.mqtt_port}")
+            # Broker may have lost state; send every value again
+            self._resend_state = True
+            # Retained health/availability may be gone too (non-persistent broker)
+            self._reconnected = True
+            # Republish discovery whenever Home Assistant comes (back) online
+            try:
+                self.client.subscribe(HA_STATUS_TOPIC)
+            except Exception as e:
+                logger.debug(f"Failed to subscribe to {HA_STATUS_TOPIC}: {e}")
+            logger.info(f"✅ Connected to MQTT broker {self.connection_config.mqtt_host}:{self.connection_config.mqtt_port}")
             # Publish availability online
             try:
-                self.client.publish(self._availability_topic, payload="online", qos=1, retain=True)
+                # Outside the window: QoS 1/2 messages queued while offline may still fill it
+                self._publish(self._availability_topic, "online", "availability", retain=True, bypass_window=True)
             except Exception as e:
                 logger.debug(f"Failed to publish availability online: {e}")
         else:
@@ -61,31 +255,110 @@ class MultiBatteryMQTTPublisher:
     def _on_disconnect(self, client, userdata, rc):
         """Callback for MQTT disconnection"""
         self.connected = False
+        self.delivery.connection_lost(self.qos)
         if rc != 0:
             logger.warning("📡 Unexpected MQTT disconnect; attempting reconnect...")
             self._attempt_reconnect()
         else:
             logger.info("📡 Disconnected from MQTT broker")
     
+    def _on_message(self, client, userdata, msg):
+        """Callback for subscribed topics (Home Assistant birth message)"""
+        if msg.topic != HA_STATUS_TOPIC:
+            return
+        payload = msg.payload.decode('utf-8', 'replace').strip().lower()
+        logger.info(f"🏠 Home Assistant status: {payload}")
+        if payload == "online":
+            # HA restarted: it needs discovery and current values again. Done by the
+            # next publish; this thread must not wait on the in-flight window.
+            self._ha_restarted = True
+
+    def request_discovery(self, battery_names: List[str]) -> None:
+        """Have the publishing thread send discovery for battery_names with its next sample.
+
+        For callers that must not wait for the broker (the polling thread);
+        while disconnected the request waits for the connection to return.
+        """
+        with self._state_lock:
+            self._discovery_batteries = list(battery_names)
+        self._discovery_requested = True
+
+    def _apply_resend_requests(self) -> None:
+        """Carry out what other threads flagged (call from the publishing thread)"""
+        if self._ha_restarted or self._discovery_requested:
+            # HA restarted: resend every config; otherwise only the changed ones
+            force = self._ha_restarted
+            self._ha_restarted = self._discovery_requested = False
+            with self._state_lock:
+                batteries = list(self._discovery_batteries)
+            if batteries and not self.publish_multi_battery_discovery(batteries, force=force):
+                if force:
+                    self._ha_restarted = True
+                else:
+                    self._discovery_requested = True
+            if force:
+                self._resend_state = True
+        if self._resend_state:
+            self._resend_state = False
+            with self._state_lock:
+                self._last_published.clear()
+
     def _on_publish(self, client, userdata, mid):
         """Callback for MQTT message publishing"""
+        self.delivery.acked(mid)
         logger.debug(f"📤 MQTT message published: {mid}")
+
+    def register_publish_worker(self) -> None:
+        """Let the calling thread wait for a free in-flight slot (publish workers only)"""
+        self._window_waiters.add(threading.get_ident())
+
+    def _publish(self, topic: str, payload: str, topic_class: str, retain: bool = False,
+                 bypass_window: bool = False) -> bool:
+        """Publish with the topic class's QoS, in-flight window and delivery tracking.
+
+        Returns False when the window stayed full or paho refused the message
+        (a QoS 1/2 message queued by paho while disconnected is accepted).
+        Only registered publish workers wait for a free slot, up to
+        publish_window_timeout; other callers get False at once. bypass_window
+        skips the window (still tracked) for the add-on's own online/offline.
+        """
+        may_wait = threading.get_ident() in self._window_waiters
+        if not bypass_window and not self.delivery.acquire(self.publish_window_timeout if may_wait else None):
+            logger.warning(f"⏳ MQTT in-flight window full ({self.delivery.max_in_flight}); not publishing {topic}")
+            return False
+        started = time.monotonic()
+        qos = self.qos[topic_class]
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc == mqtt.MQTT_ERR_NO_CONN and qos > 0 and info.mid:
+            # Not failed: paho keeps QoS 1/2 messages and sends them after reconnecting
+            self.delivery.sent(info.mid, topic_class, started, offline=True)
+            return True
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.delivery.failed()
+            logger.debug(f"Publish to {topic} failed: rc={info.rc}")
+            return False
+        self.delivery.sent(info.mid, topic_class, started)
+        return True
+
+    def get_delivery_stats(self) -> Dict[str, Any]:
+        """In-flight, ack and latency histogram metrics"""
+        return self.delivery.as_dict()
     
     def connect(self, timeout: int = 10, retries: int = 3) -> bool:
         """Connects to MQTT broker with retry mechanism"""
         for attempt in range(retries):
             try:
-                logger.info(f"📡 Attempt #{attempt + 1}: Connecting to MQTT {self.config.mqtt_host}:{self.config.mqtt_port}")
+                logger.info(f"📡 Attempt #{attempt + 1}: Connecting to MQTT {self.connection_config.mqtt_host}:{self.connection_config.mqtt_port}")
                 
                 # Network availability diagnostics
                 logger.info("🔍 MQTT connection diagnostics:")
-                logger.info(f"   Host: {self.config.mqtt_host}")
-                logger.info(f"   Port: {self.config.mqtt_port}")
-                logger.info(f"   Username: {'***' if self.config.mqtt_username else 'none'}")
-                logger.info(f"   Password: {'***' if self.config.mqtt_password else 'none'}")
+                logger.info(f"   Host: {self.connection_config.mqtt_host}")
+                logger.info(f"   Port: {self.connection_config.mqtt_port}")
+                logger.info(f"   Username: {'***' if self.connection_config.mqtt_username else 'none'}")
+                logger.info(f"   Password: {'***' if self.connection_config.mqtt_password else 'none'}")
                 
                 # Connect to MQTT and start loop once
-                self.client.connect(self.config.mqtt_host, self.config.mqtt_port, 60)
+                self.client.connect(self.connection_config.mqtt_host, self.connection_config.mqtt_port, 60)
                 if not self._loop_running:
                     self.client.loop_start()
                     self._loop_running = True
@@ -114,11 +387,18 @@ class MultiBatteryMQTTPublisher:
         logger.error(f"❌ Failed to connect to MQTT after {retries} attempts")
         return False
     
+    def start_connect(self) -> None:
+        """Start a non-blocking connection attempt handled by the network loop"""
+        self.client.connect_async(self.connection_config.mqtt_host, self.connection_config.mqtt_port, 60)
+        if not self._loop_running:
+            self.client.loop_start()
+            self._loop_running = True
+
     def disconnect(self):
         """Disconnects from MQTT broker"""
         # Publish offline for graceful shutdown
         try:
-            self.client.publish(self._availability_topic, payload="offline", qos=1, retain=True)
+            self._publish(self._availability_topic, "offline", "availability", retain=True, bypass_window=True)
         except Exception:
             pass
         if self._loop_running:
@@ -152,46 +432,82 @@ class MultiBatteryMQTTPublisher:
             waited += 0.5
         return self.connected
     
-    def publish_multi_battery_discovery(self, battery_names: List[str]) -> bool:
-        """Publishes Home Assistant Auto Discovery for all batteries"""
+    def publish_multi_battery_discovery(self, battery_names: List[str], force: bool = False) -> bool:
+        """Publishes Home Assistant Auto Discovery for all batteries.
+
+        Only configs whose content changed since they were last published
+        (hash cache persisted across restarts) are sent; force sends all.
+        Cache entries of topics no longer in use (removed batteries) are
+        dropped.
+        """
+        with self._state_lock:
+            self._discovery_batteries = list(battery_names)
         if not self.connected and not self.ensure_connected(timeout=3):
             logger.error("❌ Not connected to MQTT - cannot publish discovery")
             return False
         
         logger.info(f"📤 Publishing Auto Discovery for {len(battery_names)} batteries...")
         
-        success_count = 0
-        
-        # Discovery for each individual battery
-        for battery_name in battery_names:
-            if self._publish_battery_discovery(battery_name):
-                success_count += 1
-        
+        devices = [(battery_name, False) for battery_name in battery_names]
         # Discovery for virtual battery (if enabled)
         if self.config.enable_virtual_battery and len(battery_names) > 1:
-            if self._publish_battery_discovery("_virtual_battery", is_virtual=True):
-                success_count += 1
-        
-        logger.info(f"📤 Auto Discovery published for {success_count} batteries")
+            devices.append(("_virtual_battery", True))
+
+        success_count = 0
+        counts = {'published': 0, 'unchanged': 0}
+        with self._state_lock:
+            for battery_name, is_virtual in devices:
+                if self._publish_battery_discovery(battery_name, is_virtual=is_virtual, force=force, counts=counts):
+                    success_count += 1
+
+            in_use = {self._discovery_topic(self._device_id(name, is_virtual), sensor)
+                      for name, is_virtual in devices for sensor in self._get_sensor_definitions(is_virtual)}
+            stale = [topic for topic in self._discovery_hashes if topic not in in_use]
+            for topic in stale:
+                del self._discovery_hashes[topic]
+            if counts['published'] or stale:
+                self._save_discovery_cache()
+        logger.info(f"📤 Auto Discovery published for {success_count} batteries "
+                    f"({counts['published']} configs sent, {counts['unchanged']} unchanged)")
         return success_count > 0
+
+    def _load_discovery_cache(self) -> Dict[str, str]:
+        try:
+            if os.path.exists(self._discovery_cache_path):
+                with open(self._discovery_cache_path, "r") as f:
+                    data = json.load(f)
+                    if isinstance(data, dict):
+                        return data
+        except Exception:
+            logger.debug("Discovery cache unreadable; starting fresh")
+        return {}
+
+    def _save_discovery_cache(self) -> None:
+        try:
+            tmp = self._discovery_cache_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._discovery_hashes, f)
+            os.replace(tmp, self._discovery_cache_path)
+        except Exception as e:
+            logger.debug(f"Failed to save discovery cache: {e}")
     
-    def _publish_battery_discovery(self, battery_name: str, is_virtual: bool = False) -> bool:
-        """Publishes discovery config for one battery"""
+    def _publish_battery_discovery(self, battery_name: str, is_virtual: bool = False,
+                                   force: bool = False, counts: Dict[str, int] = None) -> bool:
+        """Publishes discovery config for one battery (changed configs only unless force)"""
         try:
             # Determine device name
+            device_id = self._device_id(battery_name, is_virtual)
             if is_virtual:
                 device_name = self.config.virtual_battery_name
-                device_id = f"{self.config.device_id}_virtual"
             else:
                 device_name = battery_name
-                device_id = f"{self.config.device_id}_{battery_name.lower().replace(' ', '_')}"
             
             # Sensor definitions
             sensors = self._get_sensor_definitions(is_virtual)
             
             # Publish discovery for each sensor
             for sensor in sensors:
-                discovery_topic = f"homeassistant/sensor/{device_id}/{sensor['object_id']}/config"
+                discovery_topic = self._discovery_topic(device_id, sensor)
                 state_topic = f"bms/{device_id}/{sensor['object_id']}"
                 
                 config = {
@@ -212,6 +528,12 @@ class MultiBatteryMQTTPublisher:
                 for attr in ['unit_of_measurement', 'device_class', 'state_class', 'icon']:
                     if attr in sensor:
                         config[attr] = sensor[attr]
+                if sensor.get('attributes'):
+                    config["json_attributes_topic"] = f"{state_topic}/attributes"
+                if self.json_state and 'data_key' in sensor:
+                    # One JSON payload per device; each entity picks its field
+                    config["state_topic"] = self._state_topic(device_id)
+                    config["value_template"] = f"{{{{ value_json.{sensor['object_id']} }}}}"
                 
                 # Add availability to discovery so HA shows correct status
                 config["availability"] = [{
@@ -219,9 +541,27 @@ class MultiBatteryMQTTPublisher:
                     "payload_available": "online",
                     "payload_not_available": "offline"
                 }]
+                if not is_virtual and 'data_key' in sensor:
+                    # Readings also go unavailable when this pack stops answering
+                    config["availability"].append({
+                        "topic": self._battery_availability_topic(device_id),
+                        "payload_available": "online",
+                        "payload_not_available": "offline"
+                    })
+                    config["availability_mode"] = "all"
 
-                # Publish
-                self.client.publish(discovery_topic, json.dumps(config), retain=True)
+                # Publish only what changed; retained configs on the broker are still valid
+                payload = json.dumps(config, sort_keys=True)
+                digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+                if not force and self._discovery_hashes.get(discovery_topic) == digest:
+                    if counts is not None:
+                        counts['unchanged'] += 1
+                    continue
+                if not self._publish(discovery_topic, payload, "discovery", retain=True):
+                    return False
+                self._discovery_hashes[discovery_topic] = digest
+                if counts is not None:
+                    counts['published'] += 1
                 logger.debug(f"Published discovery for {device_name} {sensor['name']}")
             
             return True
@@ -230,12 +570,30 @@ class MultiBatteryMQTTPublisher:
             logger.error(f"❌ Error publishing discovery for {battery_name}: {e}")
             return False
     
+    @staticmethod
+    def _discovery_topic(device_id: str, sensor: Dict) -> str:
+        return f"homeassistant/sensor/{device_id}/{sensor['object_id']}/config"
+
     def _get_sensor_definitions(self, is_virtual: bool = False) -> List[Dict]:
-        """Returns sensor definitions for battery"""
+        """Returns sensor definitions for battery (built once per device kind)"""
+        sensors = self._sensor_definitions.get(is_virtual)
+        if sensors is None:
+            sensors = self._sensor_definitions[is_virtual] = self._build_sensor_definitions(is_virtual)
+        return sensors
+
+    def _build_sensor_definitions(self, is_virtual: bool = False) -> List[Dict]:
+        """Builds sensor definitions for battery.
+
+        data_key is the field of the reading; deadband (absolute) and
+        deadband_pct (relative to the last published value) set how much a
+        value must move before it is republished (publish_on_change).
+        """
         base_sensors = [
             {
                 "name": "SOC",
                 "object_id": "soc",
+                "data_key": "soc_percent",
+                "deadband": 0.5,
                 "unit_of_measurement": "%",
                 "device_class": "battery",
                 "state_class": "measurement",
@@ -244,6 +602,8 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Pack Voltage",
                 "object_id": "pack_voltage",
+                "data_key": "pack_voltage_v",
+                "deadband": 0.05,
                 "unit_of_measurement": "V",
                 "device_class": "voltage",
                 "state_class": "measurement",
@@ -252,6 +612,8 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Pack Current",
                 "object_id": "pack_current",
+                "data_key": "pack_current_a",
+                "deadband": 0.1,
                 "unit_of_measurement": "A",
                 "device_class": "current",
                 "state_class": "measurement",
@@ -260,6 +622,9 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Power",
                 "object_id": "power",
+                "data_key": "power_w",
+                "deadband": 5.0,
+                "deadband_pct": 2.0,
                 "unit_of_measurement": "W",
                 "device_class": "power",
                 "state_class": "measurement",
@@ -268,6 +633,8 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Remaining Capacity",
                 "object_id": "remaining_capacity",
+                "data_key": "remaining_capacity_ah",
+                "deadband": 0.1,
                 "unit_of_measurement": "Ah",
                 "state_class": "measurement",
                 "icon": "mdi:battery-charging"
@@ -275,6 +642,8 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Temperature",
                 "object_id": "temperature",
+                "data_key": "temperature_1_c",
+                "deadband": 0.5,
                 "unit_of_measurement": "°C",
                 "device_class": "temperature",
                 "state_class": "measurement",
@@ -283,6 +652,8 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Min Cell Voltage",
                 "object_id": "min_cell_voltage",
+                "data_key": "min_cell_voltage_v",
+                "deadband": 0.005,
                 "unit_of_measurement": "V",
                 "device_class": "voltage",
                 "state_class": "measurement",
@@ -291,6 +662,8 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Max Cell Voltage",
                 "object_id": "max_cell_voltage",
+                "data_key": "max_cell_voltage_v",
+                "deadband": 0.005,
                 "unit_of_measurement": "V",
                 "device_class": "voltage",
                 "state_class": "measurement",
@@ -299,6 +672,8 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Cell Voltage Difference",
                 "object_id": "cell_voltage_diff",
+                "data_key": "cell_voltage_diff_v",
+                "deadband": 0.005,
                 "unit_of_measurement": "V",
                 "device_class": "voltage",
                 "state_class": "measurement",
@@ -307,11 +682,14 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Status",
                 "object_id": "status",
+                "data_key": "status",
                 "icon": "mdi:information"
             },
             {
                 "name": "Energy In Total",
                 "object_id": "energy_in_total",
+                "data_key": "energy_in_kwh",
+                "deadband": 0.01,
                 "unit_of_measurement": "kWh",
                 "device_class": "energy",
                 "state_class": "total_increasing",
@@ -320,6 +698,8 @@ class MultiBatteryMQTTPublisher:
             {
                 "name": "Energy Out Total",
                 "object_id": "energy_out_total",
+                "data_key": "energy_out_kwh",
+                "deadband": 0.01,
                 "unit_of_measurement": "kWh",
                 "device_class": "energy",
                 "state_class": "total_increasing",
@@ -333,94 +713,205 @@ class MultiBatteryMQTTPublisher:
                 {
                     "name": "Battery Count",
                     "object_id": "battery_count",
+                    "data_key": "battery_count",
                     "state_class": "measurement",
                     "icon": "mdi:counter"
                 },
                 {
                     "name": "Connected Batteries",
                     "object_id": "connected_batteries",
+                    "data_key": "connected_batteries",
                     "icon": "mdi:battery-outline"
                 }
             ]
             base_sensors.extend(virtual_sensors)
+        else:
+            # Circuit breaker state, published only when it changes
+            base_sensors.append({
+                "name": "Health",
+                "object_id": "health",
+                "icon": "mdi:heart-pulse",
+                "attributes": True
+            })
         
         return base_sensors
     
-    def publish_battery_data(self, battery_name: str, data: Dict[str, Any], is_virtual: bool = False) -> bool:
+    def publish_battery_data(self, battery_name: str, data: Dict[str, Any], is_virtual: bool = False,
+                             reconnect_timeout: float = 3) -> bool:
         """Publishes data for one battery"""
         if not self.connected:
             # Try a quick reconnect before failing
-            if not self.ensure_connected(timeout=3):
+            if not self.ensure_connected(timeout=reconnect_timeout):
                 logger.error("❌ Not connected to MQTT - cannot publish data")
                 return False
         
         try:
-            # Determine device_id
-            if is_virtual:
-                device_id = f"{self.config.device_id}_virtual"
-            else:
-                device_id = f"{self.config.device_id}_{battery_name.lower().replace(' ', '_')}"
-            
-            # Publish individual sensors
-            sensor_mappings = {
-                'soc': 'soc_percent',
-                'pack_voltage': 'pack_voltage_v',
-                'pack_current': 'pack_current_a',
-                'power': 'power_w',
-                'remaining_capacity': 'remaining_capacity_ah',
-                'temperature': 'temperature_1_c',
-                'min_cell_voltage': 'min_cell_voltage_v',
-                'max_cell_voltage': 'max_cell_voltage_v',
-                'cell_voltage_diff': 'cell_voltage_diff_v',
-                'status': 'status',
-                # Energy counters (kWh)
-                'energy_in_total': 'energy_in_kwh',
-                'energy_out_total': 'energy_out_kwh'
-            }
+            with self._state_lock:
+                device_id = self._device_id(battery_name, is_virtual)
             
-            # Add special mappings for virtual battery
-            if is_virtual:
-                sensor_mappings.update({
-                    'battery_count': 'battery_count',
-                    'connected_batteries': 'connected_batteries'
-                })
-            
-            published_count = 0
-            for sensor_id, data_key in sensor_mappings.items():
-                if data_key in data:
-                    topic = f"bms/{device_id}/{sensor_id}"
-                    value = data[data_key]
-                    
-                    # Special handling for some data types
-                    if isinstance(value, list):
-                        value = ', '.join(map(str, value))
-                    elif isinstance(value, float):
-                        value = round(value, 3)
-                    
-                    self.client.publish(topic, str(value))
-                    published_count += 1
+                values = {}
+                for sensor in self._get_sensor_definitions(is_virtual):
+                    data_key = sensor.get('data_key')
+                    if data_key and data_key in data:
+                        values[sensor['object_id']] = self._format_value(data[data_key])
+
+                now = time.monotonic()
+                sensors = {sensor['object_id']: sensor for sensor in self._get_sensor_definitions(is_virtual)}
+                if self.json_state:
+                    # The payload is all-or-nothing: any field moving past its deadband sends all of them
+                    topic = self._state_topic(device_id)
+                    changed = [sid for sid, value in values.items()
+                               if self._should_publish(f"{topic}#{sid}", sensors[sid], value, now)]
+                    if changed:
+                        if not self._publish(topic, json.dumps(values), "state"):
+                            return False
+                        for sensor_id, value in values.items():
+                            self._last_published[f"{topic}#{sensor_id}"] = (value, now)
+                        self.publish_stats['sent'] += 1
+                    else:
+                        self.publish_stats['suppressed'] += 1
+                    published_count = len(values) if changed else 0
+                else:
+                    # Publish individual sensors
+                    published_count = 0
+                    for sensor_id, value in values.items():
+                        topic = f"bms/{device_id}/{sensor_id}"
+                        if not self._should_publish(topic, sensors[sensor_id], value, now):
+                            self.publish_stats['suppressed'] += 1
+                            continue
+                        if not self._publish(topic, str(value), "state"):
+                            return False
+                        self._last_published[topic] = (value, now)
+                        self.publish_stats['sent'] += 1
+                        published_count += 1
             
-            logger.debug(f"📤 Published {published_count} sensors for {battery_name}")
-            return True
+                logger.debug(f"📤 Published {published_count}/{len(values)} sensors for {battery_name}")
+                return True
             
         except Exception as e:
             logger.error(f"❌ Error publishing data for {battery_name}: {e}")
             return False
     
-    def publish_all_battery_data(self, all_data: Dict[str, Dict[str, Any]]) -> bool:
-        """Publishes data for all batteries"""
-        if not self.connected and not self.ensure_connected(timeout=3):
+    def _should_publish(self, key: str, sensor: Dict, value: Any, now: float) -> bool:
+        """Deadband/heartbeat decision for one topic (or JSON field)"""
+        if not self.publish_on_change:
+            return True
+        last = self._last_published.get(key)
+        if last is None:
+            return True
+        last_value, last_time = last
+        if now - last_time >= self.heartbeat_interval:
+            return True
+        numeric = (int, float)
+        if (not isinstance(value, numeric) or not isinstance(last_value, numeric)
+                or isinstance(value, bool)):
+            return value != last_value
+        threshold = max(sensor.get('deadband', 0.0),
+                        abs(last_value) * sensor.get('deadband_pct', 0.0) / 100.0)
+        if threshold <= 0:
+            return value != last_value
+        return abs(value - last_value) >= threshold
+
+    def get_publish_stats(self) -> Dict[str, int]:
+        """Sent vs suppressed state messages since start"""
+        return dict(self.publish_stats)
+
+    def _device_id(self, battery_name: str, is_virtual: bool = False) -> str:
+        """Home Assistant device id of a battery (or the virtual battery)"""
+        if is_virtual:
+            return f"{self.connection_config.device_id}_virtual"
+        return f"{self.connection_config.device_id}_{battery_name.lower().replace(' ', '_')}"
+
+    @staticmethod
+    def _battery_availability_topic(device_id: str) -> str:
+        """Per-battery availability (the add-on-wide LWT topic is separate)"""
+        return f"bms/{device_id}/availability"
+
+    @staticmethod
+    def _state_topic(device_id: str) -> str:
+        """Single JSON state topic of a device (mqtt_json_state mode)"""
+        return f"bms/{device_id}/state"
+
+    @staticmethod
+    def _format_value(value: Any) -> Any:
+        """Sensor value as published: lists joined, floats rounded"""
+        if isinstance(value, list):
+            return ', '.join(map(str, value))
+        if isinstance(value, float):
+            return round(value, 3)
+        return value
+
+    def publish_battery_health(self, states: Dict[str, Dict[str, Any]]) -> bool:
+        """Publishes health state (retained) for batteries whose state changed"""
+        if not self.connected:
+            return False
+        try:
+            for battery_name, state in states.items():
+                topic = f"bms/{self._device_id(battery_name)}/health"
+                if not (self._publish(topic, state['state'], "availability", retain=True)
+                        and self._publish(f"{topic}/attributes", json.dumps(state), "availability", retain=True)):
+                    return False
+                logger.debug(f"📤 Published health for {battery_name}: {state['state']}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error publishing battery health: {e}")
+            return False
+
+    def publish_battery_availability(self, availability: Dict[str, bool]) -> bool:
+        """Publishes per-battery availability (retained) for batteries whose availability changed"""
+        if not self.connected:
+            return False
+        try:
+            for battery_name, online in availability.items():
+                topic = self._battery_availability_topic(self._device_id(battery_name))
+                if not self._publish(topic, "online" if online else "offline", "availability", retain=True):
+                    return False
+                logger.debug(f"📤 Published availability for {battery_name}: {'online' if online else 'offline'}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error publishing battery availability: {e}")
+            return False
+
+    def take_reconnected(self) -> bool:
+        """True once after each (re)connect: retained per-battery state must be sent again"""
+        reconnected, self._reconnected = self._reconnected, False
+        return reconnected
+
+    def state_fields(self, is_virtual: bool = False) -> List[str]:
+        """Reading fields published for a device kind (all a queued sample needs to keep)"""
+        return [s['data_key'] for s in self._get_sensor_definitions(is_virtual) if s.get('data_key')]
+
+    def publish_all_battery_data(self, all_data: Dict[str, Dict[str, Any]], reconnect_timeout: float = 3,
+                                 failed: Optional[List[str]] = None) -> bool:
+        """Publishes data for all batteries.
+
+        reconnect_timeout bounds how long to wait for a reconnect when the
+        broker is gone; 0 only triggers the reconnect and returns at once.
+        failed, if given, receives the names of batteries that were not
+        published so a caller can retry just those.
+        """
+        if not self.connected and not self.ensure_connected(timeout=reconnect_timeout):
             logger.error("❌ Not connected to MQTT - cannot publish data")
+            if failed is not None:
+                failed.extend(all_data)
             return False
         
+        self._apply_resend_requests()
         success_count = 0
         
         for battery_name, data in all_data.items():
             is_virtual = battery_name == "_virtual_battery"
-            if self.publish_battery_data(battery_name, data, is_virtual):
+            if self.publish_battery_data(battery_name, data, is_virtual, reconnect_timeout):
                 success_count += 1
+            elif failed is not None:
+                failed.append(battery_name)
         
         logger.info(f"📤 Published data for {success_count}/{len(all_data)} batteries")
+        if self.publish_on_change:
+            logger.info(f"📊 MQTT messages sent: {self.publish_stats['sent']}, "
+                        f"suppressed (unchanged): {self.publish_stats['suppressed']}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"📬 MQTT delivery: {self.get_delivery_stats()}")
         return success_count > 0
 
 
@@ -5,17 +5,23 @@ Multi-Battery Manager for aggregating data from multiple BMS units
 
 import logging
 import time
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
 from statistics import mean
 
-from modbus import request_device_info
-from bms_parser import BMSParser
+from modbus import request_device_info, get_port_manager, ExchangeTiming
+from bms_parser import BMSParser, BMSFrame, FrameChecksumError
 from addon_config import BatteryConfig, get_config
 from energy_tracker import EnergyTracker
+from latency import LatencyStats
+from health import BatteryHealth, DEGRADED, OPEN
 
 
 logger = logging.getLogger(__name__)
 
+# Outcome of reading one battery: parsed frame (or None) and the error raised, if any
+Reading = Tuple[Optional[BMSFrame], Optional[Exception]]
+
 
 class VirtualBattery:
     """Virtual battery that aggregates data from multiple physical batteries"""
@@ -24,7 +30,7 @@ class VirtualBattery:
         self.name = name
         self.batteries_data = {}
         
-    def add_battery_data(self, battery_id: str, data: Dict[str, Any]):
+    def add_battery_data(self, battery_id: str, data: BMSFrame):
         """Add data from a single battery"""
         if data:
             self.batteries_data[battery_id] = data
@@ -113,6 +119,9 @@ class VirtualBattery:
         """Collect all cell voltages from all batteries"""
         all_cells = []
         for data in all_data:
+            if isinstance(data, BMSFrame):
+                all_cells.extend(mv / 1000.0 for mv in data.cell_mv)
+                continue
             cells = data.get('cell_voltages_v', [])
             if isinstance(cells, list):
                 all_cells.extend(cells)
@@ -126,121 +135,363 @@ class MultiBatteryManager:
         self.batteries = batteries
         self.enable_virtual = enable_virtual
         self.virtual_battery = VirtualBattery() if enable_virtual else None
+        # Virtual battery aggregate of the last cycle (energy integrated with the packs)
+        self._virtual_aggregate: Dict[str, Any] = {}
         self.parser = BMSParser()
+        # Long-lived serial handles shared with discovery (one per bus)
+        self.port_manager = get_port_manager()
+        # Frames dropped for bad LENGTH/frame checksums, per battery name
+        self.rejected_frames: Dict[str, int] = {}
         # Energy tracking setup
         cfg = get_config()
         self._base_device_id = cfg.device_id
-        self._energy_tracker = EnergyTracker()
+        self._energy_tracker = EnergyTracker(
+            flush_interval=getattr(cfg, 'energy_flush_interval', 60),
+            storage=getattr(cfg, 'energy_storage', 'json'),
+            max_gap=getattr(cfg, 'energy_max_gap', EnergyTracker.MAX_GAP)
+        )
+        # Response latency per battery and per bus, used for adaptive timeouts
+        self.adaptive_timeout = bool(getattr(cfg, 'adaptive_timeout', True))
+        self._latency: Dict[str, LatencyStats] = {}
+        self._bus_latency: Dict[str, LatencyStats] = {}
+        # Circuit breaker per battery; names whose state changed since the last publish
+        self.circuit_breaker = bool(getattr(cfg, 'circuit_breaker', True))
+        self.health: Dict[str, BatteryHealth] = {b.name: BatteryHealth() for b in batteries}
+        self._health_changed = set(self.health)
+        # Availability last published per battery (published on transitions only)
+        self._published_availability: Dict[str, bool] = {}
+        # True while read_all_batteries is talking to the buses (background scans stay off)
+        self.polling = False
         
         # Log battery configuration on startup
         self._log_battery_configuration()
         
-    def read_all_batteries(self) -> Dict[str, Dict[str, Any]]:
-        """Read data from all enabled batteries with detailed logging"""
-        results = {}
+    def read_all_batteries(self) -> Dict[str, BMSFrame]:
+        """Read data from all enabled batteries with detailed logging.
+
+        Batteries are grouped by bus and the buses are polled concurrently;
+        requests on one bus stay strictly sequential.
+        """
+        self.polling = True
+        try:
+            enabled_batteries = self.start_cycle()
+
+            started = time.monotonic()
+            readings = self._poll_buses(enabled_batteries)
+            return self.finish_cycle(enabled_batteries, readings, time.monotonic() - started)
+        finally:
+            self.polling = False
+
+    def add_battery(self, battery: BatteryConfig) -> bool:
+        """Attach a battery at runtime (e.g. found by the hot-plug scanner).
+
+        Call between cycles. Returns False when its name or its port and
+        address are already in use.
+        """
+        key = (self.port_manager.bus_key(battery.port), battery.address)
+        for existing in self.batteries:
+            if existing.name == battery.name or (self.port_manager.bus_key(existing.port), existing.address) == key:
+                return False
+        self.batteries.append(battery)
+        self.health[battery.name] = BatteryHealth()
+        self._health_changed.add(battery.name)
+        logger.info(f"➕ Attached {battery.name} (Port: {battery.port}, Address: {battery.address})")
+        return True
+
+    def remove_battery(self, name: str) -> bool:
+        """Stop polling a battery at runtime (call between cycles)"""
+        for i, battery in enumerate(self.batteries):
+            if battery.name == name:
+                del self.batteries[i]
+                self.health.pop(name, None)
+                self._health_changed.discard(name)
+                self._published_availability.pop(name, None)
+                self._latency.pop(name, None)
+                logger.info(f"➖ Detached {name}")
+                return True
+        return False
+
+    def apply_config_diff(self, diff) -> List[str]:
+        """Apply the battery part of a config reload; returns the removed names.
+
+        Changed batteries (other port, address, baud rate or timeout) are
+        swapped in place and start with fresh latency statistics; their
+        health and energy counters carry over since the name is the same.
+        """
+        removed = [b.name for b in diff.removed if self.remove_battery(b.name)]
+        for battery in diff.changed:
+            for i, existing in enumerate(self.batteries):
+                if existing.name == battery.name:
+                    self.batteries[i] = battery
+                    self._latency.pop(battery.name, None)
+                    logger.info(f"🔧 Updated {battery.name} (Port: {battery.port}, Address: {battery.address}, "
+                                f"Baudrate: {battery.baudrate}, Timeout: {battery.timeout}s)")
+                    break
+        for battery in diff.added:
+            if not self.add_battery(battery):
+                logger.warning(f"⚠️ Cannot add {battery.name}: name or port/address already in use")
+        return removed
+
+    def start_cycle(self) -> List[BatteryConfig]:
+        """Begin a reading cycle and return the batteries to poll"""
         enabled_batteries = [b for b in self.batteries if b.enabled]
 
         logger.info("📊 ===== BATTERY READING CYCLE =====")
         logger.info(f"🔄 Reading data from {len(enabled_batteries)} enabled batteries...")
 
-        successful_reads = 0
-        failed_reads = 0
-
         # Reset virtual battery aggregation each cycle to avoid stale data
         if self.virtual_battery is not None:
             self.virtual_battery.batteries_data = {}
-        
+        self._virtual_aggregate = {}
+
         for battery in self.batteries:
             if not battery.enabled:
                 logger.debug(f"⏭️  Skipping disabled battery: {battery.name}")
-                continue
-                
-            logger.info(f"📤 Reading {battery.name} (Port: {battery.port}, Address: {battery.address})")
-            
-            try:
-                data = self._read_single_battery(battery)
-                if data:
-                    results[battery.name] = data
-                    successful_reads += 1
-                    
-                    # Enhanced logging with more details
-                    soc = data.get('soc_percent', 0)
-                    voltage = data.get('pack_voltage_v', 0)
-                    current = data.get('pack_current_a', 0)
-                    power = data.get('power_w', 0)
-                    temp = data.get('temperature_1_c', 0)
-                    status = data.get('status', 'unknown')
-                    
-                    logger.info(f"✅ {battery.name}: SOC {soc:.1f}%, "
-                              f"Voltage {voltage:.2f}V, Current {current:.2f}A, "
-                              f"Power {power:.1f}W, Temp {temp:.1f}°C, Status: {status}")
-                    
-                    # Add to virtual battery
-                    if self.virtual_battery:
-                        self.virtual_battery.add_battery_data(battery.name, data)
-                else:
-                    failed_reads += 1
-                    logger.warning(f"❌ No data received from {battery.name}")
-                    
-            except Exception as e:
+
+        if not self.circuit_breaker:
+            return enabled_batteries
+
+        polled = []
+        for battery in enabled_batteries:
+            health = self.health[battery.name]
+            was_open = health.state == OPEN
+            if health.should_poll():
+                if was_open:
+                    logger.info(f"🩺 {battery.name}: probing after {health.backoff:g}s backoff")
+                polled.append(battery)
+            else:
+                logger.debug(f"⏭️  Skipping {battery.name}: circuit open")
+        return polled
+
+    def finish_cycle(
+        self,
+        enabled_batteries: List[BatteryConfig],
+        readings: Dict[str, Reading],
+        elapsed: float
+    ) -> Dict[str, BMSFrame]:
+        """Collect per-battery readings of a finished cycle.
+
+        Runs in configuration order once every bus is done, so the virtual
+        battery aggregates one consistent snapshot per cycle.
+        """
+        results = {}
+        successful_reads = 0
+        failed_reads = 0
+
+        for battery in enabled_batteries:
+            data, error = readings.get(battery.name, (None, None))
+            if error is not None or not data:
                 failed_reads += 1
-                logger.error(f"❌ Error reading {battery.name}: {e}")
+                self._record_health(battery, False, error)
                 continue
+
+            results[battery.name] = data
+            successful_reads += 1
+            self._record_health(battery, True)
+
+            # Enhanced logging with more details
+            soc = data.get('soc_percent', 0)
+            voltage = data.get('pack_voltage_v', 0)
+            current = data.get('pack_current_a', 0)
+            power = data.get('power_w', 0)
+            temp = data.get('temperature_1_c', 0)
+            status = data.get('status', 'unknown')
+
+            logger.info(f"✅ {battery.name}: SOC {soc:.1f}%, "
+                      f"Voltage {voltage:.2f}V, Current {current:.2f}A, "
+                      f"Power {power:.1f}W, Temp {temp:.1f}°C, Status: {status}")
+
+            # Add to virtual battery
+            if self.virtual_battery:
+                self.virtual_battery.add_battery_data(battery.name, data)
         
+        # One energy update (and at most one counter-file write) per cycle, virtual battery included
+        if self.virtual_battery:
+            self._virtual_aggregate = self.virtual_battery.get_aggregated_data()
+        self._integrate_energy(results, self._virtual_aggregate)
+
         # Summary logging
         logger.info("📊 ===== READING SUMMARY =====")
         logger.info(f"✅ Successful reads: {successful_reads}/{len(enabled_batteries)}")
         if failed_reads > 0:
-            logger.warning(f"❌ Failed reads: {failed_reads}")
+            logger.info(f"❌ Failed reads: {failed_reads}")
+        open_circuits = [name for name, h in self.health.items() if h.state == OPEN]
+        if self.circuit_breaker and open_circuits:
+            logger.info(f"🔌 Circuit open (not polled): {', '.join(open_circuits)}")
+        if self.rejected_frames:
+            logger.info(f"🧮 Rejected frames (bad checksum): {self.rejected_frames}")
+        logger.info(f"⏱️  Cycle read time: {elapsed:.2f}s")
+        if self.adaptive_timeout and logger.isEnabledFor(logging.DEBUG):
+            for name, stats in self.get_latency_stats().items():
+                logger.debug(f"   ⏱️ {name}: {stats}")
         logger.info("🔋 ===========================")
         
         return results
+
+    def group_by_bus(self, batteries: List[BatteryConfig]) -> Dict[str, List[BatteryConfig]]:
+        """Group batteries by bus (SerialPortManager.bus_key), keeping configuration order"""
+        buses: Dict[str, List[BatteryConfig]] = {}
+        for battery in batteries:
+            buses.setdefault(self.port_manager.bus_key(battery.port), []).append(battery)
+        return buses
+
+    def _read_bus(self, batteries: List[BatteryConfig]) -> Dict[str, Reading]:
+        """Read the batteries of one bus one after another"""
+        readings = {}
+        for battery in batteries:
+            logger.info(f"📤 Reading {battery.name} (Port: {battery.port}, Address: {battery.address})")
+            try:
+                readings[battery.name] = (self._read_single_battery(battery), None)
+            except Exception as e:
+                readings[battery.name] = (None, e)
+        return readings
+
+    def _poll_buses(self, batteries: List[BatteryConfig]) -> Dict[str, Reading]:
+        """Poll independent buses concurrently, one worker per bus"""
+        buses = self.group_by_bus(batteries)
+        if len(buses) <= 1:
+            return self._read_bus(batteries)
+
+        logger.debug(f"🧵 Polling {len(buses)} buses in parallel")
+        readings = {}
+        with ThreadPoolExecutor(max_workers=len(buses), thread_name_prefix="bms-bus") as pool:
+            for bus_readings in pool.map(self._read_bus, buses.values()):
+                readings.update(bus_readings)
+        return readings
     
-    def _read_single_battery(self, battery: BatteryConfig) -> Optional[Dict[str, Any]]:
-        """Read data from a single battery"""
-        try:
-            device_info = request_device_info(
-                port=battery.port,
-                address=battery.address,
-                baudrate=battery.baudrate,
-                timeout=battery.timeout
-            )
-            
-            if device_info and len(device_info) >= 3:
-                # Convert bytes to clean hex payload: between '~' and first '\r'
-                if isinstance(device_info, bytes):
-                    resp = device_info
-                    start = resp.find(b'~')
-                    if start == -1:
-                        start = 0
-                    end = resp.find(b'\r', start + 1)
-                    if end == -1:
-                        end = len(resp)
-                    payload = resp[start + 1:end] if start < end else resp[:end]
-                    ascii_hex = payload.decode('ascii', errors='ignore')
-                    # keep only hex digits
-                    hex_data = ''.join(ch for ch in ascii_hex if ch in '0123456789abcdefABCDEF').upper()
-                else:
-                    # assume already hex string
-                    hex_data = str(device_info)
-                    
-                parsed_data = self.parser.parse_service_42_response(hex_data)
-                
-                # Add battery identification
-                parsed_data['battery_name'] = battery.name
-                parsed_data['battery_address'] = battery.address
-                parsed_data['battery_port'] = battery.port
-                
-                # Enhance data with calculated values for MQTT compatibility
-                self._enhance_battery_data(parsed_data)
-                
-                return parsed_data
-            else:
-                logger.warning(f"Invalid data length from {battery.name}")
+    def _read_single_battery(self, battery: BatteryConfig) -> Optional[BMSFrame]:
+        """Read data from a single battery.
+
+        Communication errors propagate to _read_bus, which records them as
+        the battery's reading error for the health state machine.
+        """
+        timeout, first_byte_timeout = self.timeouts_for(battery)
+        timing = ExchangeTiming()
+        device_info = request_device_info(
+            port=battery.port,
+            address=battery.address,
+            baudrate=battery.baudrate,
+            timeout=timeout,
+            port_manager=self.port_manager,
+            first_byte_timeout=first_byte_timeout,
+            timing=timing
+        )
+        self.record_latency(battery, timing)
+        return self.decode_response(battery, device_info)
+
+    def _record_health(self, battery: BatteryConfig, ok: bool, error: Optional[Exception] = None) -> None:
+        """Feed one reading outcome into the battery's health; log transitions only"""
+        health = self.health.setdefault(battery.name, BatteryHealth())
+        if ok:
+            change = health.record_success()
+        else:
+            reason = str(error) if error is not None else "no valid response"
+            change = health.record_failure(reason)
+            logger.debug(f"❌ {battery.name}: read failed ({reason}), "
+                         f"{health.consecutive_failures} in a row")
+        if change is None:
+            return
+
+        self._health_changed.add(battery.name)
+        old, new = change
+        if new == OPEN:
+            logger.warning(f"🔌 {battery.name}: {old} → {new} after {health.consecutive_failures} failures "
+                           f"({health.last_error}); next probe in {health.backoff:g}s")
+        elif new == DEGRADED:
+            logger.warning(f"⚠️ {battery.name}: {old} → {new} ({health.last_error})")
+        else:
+            logger.info(f"✅ {battery.name}: {old} → {new}")
+
+    def get_battery_states(self) -> Dict[str, Dict[str, Any]]:
+        """Health state summary per configured battery"""
+        return {b.name: self.health.setdefault(b.name, BatteryHealth()).as_dict() for b in self.batteries}
+
+    def health_changes(self) -> Dict[str, Dict[str, Any]]:
+        """Health of batteries whose state changed and has not been published yet"""
+        return {name: self.health[name].as_dict() for name in self._health_changed if name in self.health}
+
+    def clear_health_changes(self, names) -> None:
+        """Mark health changes as published"""
+        self._health_changed.difference_update(names)
+
+    def availability_changes(self) -> Dict[str, bool]:
+        """Per-battery availability that differs from what was last published"""
+        changes = {}
+        for battery in self.batteries:
+            health = self.health.get(battery.name)
+            if health is not None and self._published_availability.get(battery.name) != health.available:
+                changes[battery.name] = health.available
+        return changes
+
+    def mark_availability_published(self, availability: Dict[str, bool]) -> None:
+        self._published_availability.update(availability)
+
+    def forget_published_state(self) -> None:
+        """Treat health and availability of every battery as unpublished (after a reconnect)"""
+        self._published_availability.clear()
+        self._health_changed.update(self.health)
+
+    def _latency_for(self, battery: BatteryConfig) -> Tuple[LatencyStats, LatencyStats]:
+        stats = self._latency.get(battery.name)
+        if stats is None:
+            stats = self._latency[battery.name] = LatencyStats()
+        bus = self.port_manager.bus_key(battery.port)
+        bus_stats = self._bus_latency.get(bus)
+        if bus_stats is None:
+            bus_stats = self._bus_latency[bus] = LatencyStats()
+        return stats, bus_stats
+
+    def timeouts_for(self, battery: BatteryConfig) -> Tuple[float, Optional[float]]:
+        """(timeout, first_byte_timeout) for the next request to battery"""
+        if not self.adaptive_timeout:
+            return battery.timeout, None
+        stats, bus_stats = self._latency_for(battery)
+        return stats.timeouts(battery.timeout, fallback=bus_stats)
+
+    def record_latency(self, battery: BatteryConfig, timing: ExchangeTiming) -> None:
+        """Feed one exchange into the battery's and its bus's latency stats"""
+        stats, bus_stats = self._latency_for(battery)
+        if timing.total is None:
+            stats.record_miss()
+            return
+        stats.record_success(timing.first_byte, timing.total)
+        bus_stats.record_success(timing.first_byte, timing.total)
+
+    def get_latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latency summary (ms) and current timeouts per battery"""
+        result = {}
+        for battery in self.batteries:
+            stats, bus_stats = self._latency_for(battery)
+            result[battery.name] = stats.as_dict(battery.timeout, fallback=bus_stats)
+        return result
+
+    def decode_response(self, battery: BatteryConfig, device_info: bytes) -> Optional[BMSFrame]:
+        """Parse a raw Service 42 response and enhance it for publishing"""
+        if device_info and len(device_info) >= 3:
+            if isinstance(device_info, str):
+                # assume already hex string
+                device_info = device_info.encode('ascii')
+            # Parse the raw frame directly (payload between '~' and first '\r')
+            try:
+                frame = self.parser.parse_frame(device_info)
+            except FrameChecksumError as e:
+                # Corrupted on the bus: never let it reach energy integration or MQTT
+                self.rejected_frames[battery.name] = self.rejected_frames.get(battery.name, 0) + 1
+                logger.warning(f"⚠️ Rejected frame from {battery.name}: {e} "
+                               f"(rejected so far: {self.rejected_frames[battery.name]})")
                 return None
-                
-        except Exception as e:
-            logger.error(f"Error communicating with {battery.name}: {e}")
+            
+            # Add battery identification
+            frame.battery_name = battery.name
+            frame.battery_address = battery.address
+            frame.battery_port = battery.port
+            
+            # Debug details (energy counters are integrated per cycle in finish_cycle)
+            self._enhance_battery_data(frame)
+            
+            return frame
+        else:
+            logger.debug(f"Invalid data length from {battery.name}")
             return None
     
     def get_virtual_battery_data(self) -> Optional[Dict[str, Any]]:
@@ -248,20 +499,13 @@ class MultiBatteryManager:
         if not self.virtual_battery:
             return None
             
-        aggregated = self.virtual_battery.get_aggregated_data()
+        # Aggregated (and energy-integrated) by finish_cycle
+        aggregated = self._virtual_aggregate
         if aggregated:
             aggregated['device_name'] = self.virtual_battery.name
             aggregated['is_virtual'] = True
-
-            # Integrate power into energy counters for virtual battery
-            try:
-                device_key = f"{self._base_device_id}_virtual"
-                e_in, e_out = self._energy_tracker.update(device_key, aggregated.get('power_w', 0.0), now_ts=time.time())
-                aggregated['energy_in_kwh'] = e_in
-                aggregated['energy_out_kwh'] = e_out
-            except Exception:
-                aggregated.setdefault('energy_in_kwh', 0.0)
-                aggregated.setdefault('energy_out_kwh', 0.0)
+            aggregated.setdefault('energy_in_kwh', 0.0)
+            aggregated.setdefault('energy_out_kwh', 0.0)
             
             # Log virtual battery summary
             logger.info(f"🏦 Virtual Battery '{self.virtual_battery.name}':")
@@ -274,11 +518,14 @@ class MultiBatteryManager:
             
         return aggregated
     
-    def get_all_data(self) -> Dict[str, Dict[str, Any]]:
+    def get_all_data(self) -> Dict[str, Any]:
         """Get data from all batteries including virtual battery"""
         # Read individual batteries
         battery_data = self.read_all_batteries()
-        
+        return self.attach_virtual_data(battery_data)
+
+    def attach_virtual_data(self, battery_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Add the aggregated virtual battery to a cycle's readings"""
         # Add virtual battery data if enabled
         if self.enable_virtual and self.virtual_battery:
             virtual_data = self.get_virtual_battery_data()
@@ -312,64 +559,46 @@ class MultiBatteryManager:
         
         logger.info("🔋 =================================")
     
-    def _enhance_battery_data(self, data: Dict[str, Any]) -> None:
-        """Enhance parsed BMS data with calculated values for MQTT compatibility"""
-        battery_name = data.get('battery_name', 'Unknown')
-        
-        # Calculate power (Voltage * Current)
-        voltage = data.get('pack_voltage_v', 0)
-        current = data.get('pack_current_a', 0)
-        data['power_w'] = voltage * current
-        
-        # Map temperature data (BMS parser provides different temperature keys)
-        temperature = None
-        if 'ambient_temp_c' in data:
-            temperature = data['ambient_temp_c']
-        elif 'pack_avg_temp_c' in data:
-            temperature = data['pack_avg_temp_c']
-        elif 'mos_temp_c' in data:
-            temperature = data['mos_temp_c']
-        
-        data['temperature_1_c'] = temperature if temperature is not None else 20.0
-        
-        # Map capacity fields to match MQTT expectations
-        if 'full_charge_capacity_ah' in data:
-            data['full_capacity_ah'] = data['full_charge_capacity_ah']
-        
-        # Calculate cell voltage statistics
-        cell_voltages = data.get('cell_voltages_v', [])
-        if cell_voltages and isinstance(cell_voltages, list) and len(cell_voltages) > 0:
-            data['min_cell_voltage_v'] = min(cell_voltages)
-            data['max_cell_voltage_v'] = max(cell_voltages)
-            data['cell_voltage_diff_v'] = data['max_cell_voltage_v'] - data['min_cell_voltage_v']
-        else:
-            data['min_cell_voltage_v'] = 0.0
-            data['max_cell_voltage_v'] = 0.0
-            data['cell_voltage_diff_v'] = 0.0
-        
-        # Determine status based on current
-        if current > 0.1:
-            data['status'] = 'charging'
-        elif current < -0.1:
-            data['status'] = 'discharging'
-        else:
-            data['status'] = 'idle'
-
-        # Integrate power into energy counters (kWh in/out)
+    def _integrate_energy(self, frames: Dict[str, BMSFrame], virtual: Optional[Dict[str, Any]] = None) -> None:
+        """Add energy counters (kWh in/out) to a cycle's frames and virtual aggregate in one bulk update"""
+        device_keys = {name: f"{self._base_device_id}_{name.lower().replace(' ', '_')}" for name in frames}
+        powers = {device_keys[name]: frame.power_w for name, frame in frames.items()}
+        virtual_key = f"{self._base_device_id}_virtual"
+        if virtual:
+            powers[virtual_key] = virtual.get('power_w', 0.0)
         try:
-            device_key = f"{self._base_device_id}_{battery_name.lower().replace(' ', '_')}"
-            e_in, e_out = self._energy_tracker.update(device_key, data.get('power_w', 0.0), now_ts=time.time())
-            data['energy_in_kwh'] = e_in
-            data['energy_out_kwh'] = e_out
+            totals = self._energy_tracker.update_many(powers)
         except Exception:
-            # Do not fail if persistence/integration has issues
-            data.setdefault('energy_in_kwh', 0.0)
-            data.setdefault('energy_out_kwh', 0.0)
+            # Do not fail if persistence/integration has issues; counters stay at 0.0
+            return
+        for name, frame in frames.items():
+            frame.energy_in_kwh, frame.energy_out_kwh = totals[device_keys[name]]
+        if virtual:
+            virtual['energy_in_kwh'], virtual['energy_out_kwh'] = totals[virtual_key]
+
+    def flush(self) -> None:
+        """Persist pending energy counters"""
+        self._energy_tracker.flush()
+
+    def close(self) -> None:
+        """Shutdown: persist energy counters and close serial ports"""
+        self._energy_tracker.close()
+        self.port_manager.close_all()
+
+    def _enhance_battery_data(self, frame: BMSFrame) -> None:
+        """Debug details of a parsed frame.
+
+        Power, temperature, capacity, cell statistics and status are derived
+        on access by BMSFrame; energy counters are added per cycle by
+        _integrate_energy.
+        """
+        battery_name = frame.battery_name or 'Unknown'
         
         # Debug logging for troubleshooting
-        logger.debug(f"📋 Enhanced data for {battery_name}:")
-        logger.debug(f"   Power: {data.get('power_w', 'N/A'):.1f}W")
-        logger.debug(f"   Temperature: {data.get('temperature_1_c', 'N/A'):.1f}°C")
-        logger.debug(f"   Cell voltages: {len(cell_voltages)} cells")
-        logger.debug(f"   Min/Max cell: {data.get('min_cell_voltage_v', 'N/A'):.3f}V / {data.get('max_cell_voltage_v', 'N/A'):.3f}V")
-        logger.debug(f"   Status: {data.get('status', 'N/A')}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"📋 Enhanced data for {battery_name}:")
+            logger.debug(f"   Power: {frame.power_w:.1f}W")
+            logger.debug(f"   Temperature: {frame.temperature_1_c:.1f}°C")
+            logger.debug(f"   Cell voltages: {frame.cell_count} cells")
+            logger.debug(f"   Min/Max cell: {frame.min_cell_voltage_v:.3f}V / {frame.max_cell_voltage_v:.3f}V")
+            logger.debug(f"   Status: {frame.status}")
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Bounded MQTT publish queue.
+
+The monitoring loop hands each cycle's readings to the queue and returns
+immediately; a worker publishes them in order whenever the broker is
+reachable. The worker is a background thread (start()) or, with the asyncio
+engine, a task on the event loop (run_async()). During an outage the newest
+samples are kept in memory (oldest dropped first) and, optionally, overflow
+is spilled to a JSON-lines file under /data so it is replayed after
+reconnecting or restarting.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPILL_PATH = "/data/mqtt_spill.jsonl"
+
+# (timestamp, {battery_name: {field: value}})
+Snapshot = Tuple[float, Dict[str, Dict[str, Any]]]
+
+
+def snapshot_data(all_data: Dict[str, Any], fields: Optional[Dict[bool, List[str]]] = None) -> Dict[str, Dict[str, Any]]:
+    """Plain, JSON-serializable copy of one cycle's readings.
+
+    fields maps is_virtual to the reading fields the publisher sends; only
+    those are kept. Without it the whole reading is copied.
+    """
+    result = {}
+    for name, data in all_data.items():
+        keys = fields.get(name == "_virtual_battery") if fields else None
+        if keys is not None:
+            result[name] = {key: data.get(key) for key in keys if key in data}
+            continue
+        to_dict = getattr(data, 'to_dict', None)
+        result[name] = to_dict() if to_dict is not None else dict(data)
+    return result
+
+
+class PublishQueue:
+    """Decouples reading from publishing.
+
+    - submit() never blocks on MQTT; when maxsize samples are waiting the
+      oldest is dropped, or appended to the spill file when spilling is on
+      (bounded by spill_max_bytes, beyond that it is dropped too)
+    - samples keep only the fields the publisher sends (publisher.state_fields)
+    - the worker publishes replayed samples, then spilled ones, then queued
+      ones, so samples go out in the order they were read; when only some
+      batteries of a sample fail, only those are retried
+    - stop() tries a final drain and spills what is left (if enabled),
+      keeping the file in read order
+    """
+
+    RETRY_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        publisher,
+        maxsize: int = 120,
+        spill: bool = False,
+        spill_path: str = DEFAULT_SPILL_PATH,
+        spill_max_bytes: int = 5 * 1024 * 1024
+    ) -> None:
+        self.publisher = publisher
+        self.maxsize = max(1, int(maxsize))
+        self.spill_path = spill_path if spill else None
+        self.spill_max_bytes = spill_max_bytes
+
+        self._queue: Deque[Snapshot] = deque()
+        self._replay: Deque[Snapshot] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # Async worker: its loop and wake-up event
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task_done: Optional[asyncio.Event] = None
+
+        self.stats = {'submitted': 0, 'published': 0, 'dropped': 0, 'spilled': 0, 'replayed': 0, 'retried': 0}
+
+    # ----------------------------------------------------------------- producer
+
+    def _fields(self) -> Optional[Dict[bool, List[str]]]:
+        state_fields = getattr(self.publisher, 'state_fields', None)
+        if state_fields is None:
+            return None
+        try:
+            return {False: state_fields(False), True: state_fields(True)}
+        except Exception:
+            return None
+
+    def submit(self, all_data: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        """Queue one cycle's readings for publishing (non-blocking)"""
+        item = (timestamp if timestamp is not None else time.time(), snapshot_data(all_data, self._fields()))
+        with self._cond:
+            self._queue.append(item)
+            self.stats['submitted'] += 1
+            while len(self._queue) > self.maxsize:
+                self._overflow(self._queue.popleft())
+            self._cond.notify()
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _overflow(self, item: Snapshot) -> None:
+        if self.spill_path and self._append_spill([item]):
+            self.stats['spilled'] += 1
+            return
+        self.stats['dropped'] += 1
+        if self.stats['dropped'] == 1 or self.stats['dropped'] % 100 == 0:
+            logger.warning(f"🗑️ MQTT publish queue full ({self.maxsize}); "
+                           f"dropped {self.stats['dropped']} oldest sample(s) so far")
+
+    def _append_spill(self, items: Iterable[Snapshot], path: Optional[str] = None) -> int:
+        """Append items to the spill file while it is under the size cap; returns how many"""
+        path = path or self.spill_path
+        written = 0
+        try:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(path, "a") as f:
+                for item in items:
+                    if size >= self.spill_max_bytes:
+                        break
+                    line = json.dumps(item) + "\n"
+                    f.write(line)
+                    size += len(line)
+                    written += 1
+        except Exception as e:
+            logger.debug(f"Failed to spill sample to {path}: {e}")
+        return written
+
+    def _read_spill(self) -> List[Snapshot]:
+        items = []
+        with open(self.spill_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    timestamp, data = json.loads(line)
+                except (ValueError, TypeError):
+                    continue
+                items.append((timestamp, data))
+        return items
+
+    def _load_spill(self) -> None:
+        """Move spilled samples into the replay buffer (called with the lock held)"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        try:
+            self._replay.extend(self._read_spill())
+            os.remove(self.spill_path)
+            if self._replay:
+                logger.info(f"📼 Replaying {len(self._replay)} spilled sample(s)")
+        except Exception as e:
+            logger.debug(f"Failed to load spill file {self.spill_path}: {e}")
+
+    # ----------------------------------------------------------------- consumer
+
+    def start(self) -> None:
+        """Start the background publisher thread"""
+        if self._thread is not None:
+            return
+        with self._cond:
+            self._load_spill()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="mqtt-publish", daemon=True)
+        self._thread.start()
+
+    def _next(self) -> Optional[Tuple[Deque[Snapshot], Snapshot]]:
+        if not self._replay:
+            self._load_spill()
+        for source in (self._replay, self._queue):
+            if source:
+                return source, source[0]
+        return None
+
+    def _settle(self, source: Deque[Snapshot], item: Snapshot, failed: List[str]) -> None:
+        """Account for one publish attempt of item (called with the lock held)"""
+        # The item may have been pushed out by overflow meanwhile
+        at_head = bool(source) and source[0] is item
+        if failed:
+            if at_head and len(failed) < len(item[1]):
+                # Retry only the batteries that were not published
+                source[0] = (item[0], {name: item[1][name] for name in failed if name in item[1]})
+                self.stats['retried'] += 1
+            return
+        if at_head:
+            source.popleft()
+        self.stats['published'] += 1
+        if source is self._replay:
+            self.stats['replayed'] += 1
+
+    def _run(self) -> None:
+        register = getattr(self.publisher, 'register_publish_worker', None)
+        if register is not None:
+            # Broker backpressure is waited out here, not in the reading cycle
+            register()
+        while True:
+            with self._cond:
+                while not self._stopping and self._next() is None:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                source, item = self._next()
+
+            failed = self._publish(item)
+            with self._cond:
+                self._settle(source, item, failed)
+                if failed:
+                    self._cond.wait(self.RETRY_INTERVAL)
+
+    def _publish(self, item: Snapshot) -> List[str]:
+        """Publish one sample; returns the batteries that failed"""
+        if not self.publisher.connected:
+            # Only nudges the reconnect; waiting happens in this thread
+            self.publisher.ensure_connected(timeout=0)
+            return list(item[1])
+        failed: List[str] = []
+        try:
+            self.publisher.publish_all_battery_data(item[1], reconnect_timeout=0, failed=failed)
+        except Exception as e:
+            logger.error(f"❌ Error publishing queued sample: {e}")
+            return list(item[1])
+        return failed
+
+    async def run_async(self, sink) -> None:
+        """Worker as an asyncio task; sink is an AsyncMQTTPublisher.
+
+        Use instead of start() with the asyncio engine: publishing stays on
+        the event loop, no extra thread is started.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task_done = asyncio.Event()
+        with self._cond:
+            self._load_spill()
+            self._stopping = False
+        try:
+            while True:
+                with self._cond:
+                    if self._stopping:
+                        return
+                    nxt = self._next()
+                if nxt is None:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                source, item = nxt
+
+                failed: List[str] = []
+                try:
+                    await sink.publish_all_battery_data(item[1], failed=failed)
+                except Exception as e:
+                    logger.error(f"❌ Error publishing queued sample: {e}")
+                    failed = list(item[1])
+                with self._cond:
+                    self._settle(source, item, failed)
+                if failed:
+                    await asyncio.sleep(self.RETRY_INTERVAL)
+        finally:
+            self._task_done.set()
+
+    async def stop_async(self, timeout: float = 5.0) -> None:
+        """Stop the async worker, giving it up to timeout seconds to drain"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.pending() and self.publisher.connected and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        with self._cond:
+            self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._task_done is not None:
+            try:
+                await asyncio.wait_for(self._task_done.wait(), max(0.0, deadline - loop.time()) + 1.0)
+            except asyncio.TimeoutError:
+                pass
+        self._loop = None
+        self._save_remaining()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the worker, giving it up to timeout seconds to drain"""
+        deadline = time.monotonic() + timeout
+        while self.pending() and self.publisher.connected and time.monotonic() < deadline:
+            time.sleep(0.1)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=max(0.0, deadline - time.monotonic()) + 1.0)
+            self._thread = None
+        self._save_remaining()
+
+    def _save_remaining(self) -> None:
+        """Spill what was not published for the next start, in read order.
+
+        Replayed samples are older than anything spilled since they were
+        loaded, and queued samples are newer, so the file is rewritten as
+        replay + file + queue.
+        """
+        with self._cond:
+            if not self.spill_path:
+                return
+            if not self._replay and not self._queue:
+                return
+            try:
+                spilled = self._read_spill() if os.path.exists(self.spill_path) else []
+                tmp = self.spill_path + ".tmp"
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                written = self._append_spill(list(self._replay) + spilled + list(self._queue), tmp)
+                os.replace(tmp, self.spill_path)
+                self.stats['spilled'] += max(0, written - len(spilled))
+            except Exception as e:
+                logger.debug(f"Failed to spill pending samples to {self.spill_path}: {e}")
+            self._replay.clear()
+            self._queue.clear()
+
+    def pending(self) -> int:
+        """Samples waiting to be published (in memory)"""
+        with self._cond:
+            return len(self._replay) + len(self._queue)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self.stats, pending=len(self._replay) + len(self._queue))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Fixed-rate scheduler for the monitoring loop.
+
+Ticks are absolute points on the monotonic clock (start + k * interval), so
+the period does not drift by however long reading and publishing took.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class FixedRateScheduler:
+    """Drift-free tick source for the monitoring loop.
+
+    - wait() / wait_async() sleep until the next absolute tick
+    - a cycle that runs past the next tick is an overrun: the late tick fires
+      immediately and any further ticks it swallowed are coalesced into it
+      and counted in missed_ticks, keeping the tick grid aligned
+    - lateness (actual wake-up minus scheduled tick) is recorded per cycle
+    """
+
+    def __init__(self, interval: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.interval = float(interval)
+        self._clock = clock
+        self._next_tick: Optional[float] = None
+        self.cycles = 0
+        self.overruns = 0
+        self.missed_ticks = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+
+    @property
+    def next_tick(self) -> Optional[float]:
+        """Monotonic time of the next scheduled tick (None before start)"""
+        return self._next_tick
+
+    def start(self) -> None:
+        """Anchor the tick grid at the current time"""
+        self._next_tick = self._clock()
+
+    def _advance(self) -> float:
+        """Move to the next tick after a cycle and return seconds to sleep."""
+        now = self._clock()
+        if self._next_tick is None:
+            self._next_tick = now
+        self._next_tick += self.interval
+
+        if now >= self._next_tick:
+            self.overruns += 1
+            overrun = now - self._next_tick
+            # Whole ticks that passed beyond the one firing now are coalesced
+            behind = int(overrun // self.interval)
+            if behind:
+                self.missed_ticks += behind
+                self._next_tick += behind * self.interval
+            logger.warning(f"⏱️ Cycle overran the {self.interval:g}s interval by {overrun:.2f}s "
+                           f"(coalesced {behind} missed tick(s), total missed: {self.missed_ticks})")
+            return 0.0
+        return self._next_tick - now
+
+    def _mark_tick(self) -> float:
+        lateness = max(0.0, self._clock() - self._next_tick)
+        self.cycles += 1
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        return lateness
+
+    def wait(self) -> float:
+        """Sleep until the next tick; returns the tick's lateness in seconds"""
+        time.sleep(self._advance())
+        return self._mark_tick()
+
+    async def wait_async(self) -> float:
+        """asyncio variant of wait()"""
+        await asyncio.sleep(self._advance())
+        return self._mark_tick()
+
+    def get_stats(self) -> Dict[str, float]:
+        """Scheduler metrics for logging/diagnostics"""
+        return {
+            'cycles': self.cycles,
+            'overruns': self.overruns,
+            'missed_ticks': self.missed_ticks,
+            'last_lateness_s': round(self.last_lateness, 4),
+            'max_lateness_s': round(self.max_lateness, 4),
+        }
@@ -0,0 +1,64 @@
+"""Service 42 parser: bytes-native parser against the hex-string parser"""
+
+import pytest
+
+from bms_parser import BMSFrame, BMSParser
+
+
+# Service 42 response of a 16-cell pack (payload between '~' and '\r')
+SAMPLE_HEX = (
+    "22014A00E0C60118FE14BC100CF40CF40CF00CF20CF30CF60D020CF50CF50CFF0CF50CF40CF80CF90CFA0CF0"
+    "00E600C800D20400C800C800C800C800000000006400294A1A6B003F0000000000000000002300000000000000"
+    "00000000000000000000000000000000D3EF"
+)
+SAMPLE_RAW = b"~" + SAMPLE_HEX.encode("ascii") + b"\r"
+
+
+def test_bytes_parser_matches_hex_parser():
+    assert BMSParser.parse_service_42_bytes(SAMPLE_RAW) == BMSParser.parse_service_42_response(SAMPLE_HEX)
+
+
+@pytest.mark.parametrize("raw", [
+    SAMPLE_RAW,
+    SAMPLE_HEX.encode("ascii"),
+    bytearray(SAMPLE_RAW),
+    b"\x00\xff" + SAMPLE_RAW + b"\n",
+])
+def test_framing_variants_parse_identically(raw):
+    assert BMSParser.parse_service_42_bytes(raw) == BMSParser.parse_service_42_response(SAMPLE_HEX)
+
+
+def test_noise_inside_payload_is_dropped():
+    noisy = SAMPLE_RAW.replace(b"0CF4", b"0C F4", 1)
+    assert BMSParser.parse_service_42_bytes(noisy) == BMSParser.parse_service_42_response(SAMPLE_HEX)
+
+
+def test_frame_values():
+    frame = BMSParser.parse_frame(SAMPLE_RAW)
+    assert isinstance(frame, BMSFrame)
+    assert frame.cell_count == 16
+    assert frame.temp_sensor_count == 4
+    assert frame.soc_percent == pytest.approx(63.98)
+    assert frame.pack_voltage_v == pytest.approx(53.08)
+    assert frame.cell_voltages_v[:3] == pytest.approx([3.316, 3.316, 3.312])
+    assert frame.full_charge_capacity_ah == pytest.approx(105.7)
+    assert frame.checksum_hex == "D3EF"
+
+
+def test_frame_mapping_access_matches_to_dict():
+    frame = BMSParser.parse_frame(SAMPLE_RAW)
+    as_dict = frame.to_dict()
+    for key, value in as_dict.items():
+        assert frame[key] == value
+        assert frame.get(key) == value
+    assert frame.get("no_such_field", 42) == 42
+
+
+def test_truncated_frame_is_rejected():
+    with pytest.raises(ValueError):
+        BMSParser.parse_frame(SAMPLE_RAW[:-10] + b"\r")
+
+
+def test_non_bytes_input_is_rejected():
+    with pytest.raises(TypeError):
+        BMSParser.parse_frame(SAMPLE_HEX)
@@ -0,0 +1,59 @@
+"""Service 42 LENGTH/frame checksum vectors and corrupted-frame rejection"""
+
+import pytest
+
+from bms_parser import BMSParser, FrameChecksumError, frame_checksum, length_checksum
+from modbus import build_service_42_frame
+
+from .test_bms_parser import SAMPLE_HEX, SAMPLE_RAW
+
+
+@pytest.mark.parametrize("length_id, expected", [
+    (0x000, 0x0),
+    (0x0C6, 0xE),   # sample response: LENGTH E0C6
+    (0x002, 0xE),   # request: LENGTH E002
+    (0x012, 0xD),
+    (0xFFF, 0x3),
+])
+def test_length_checksum(length_id, expected):
+    assert length_checksum(length_id) == expected
+
+
+def test_frame_checksum_of_sample_response():
+    assert frame_checksum(SAMPLE_HEX[:-4].encode("ascii")) == 0xD3EF
+
+
+@pytest.mark.parametrize("address, frame", [
+    (0x01, b"~22014A42E00201FD28\r"),
+    (0x02, b"~22024A42E00202FD26\r"),
+    (0x10, b"~22104A42E00210FD28\r"),   # same digit sum as 0x01
+    (0x0A, b"~220A4A42E0020AFD08\r"),
+])
+def test_request_frame_checksum_per_address(address, frame):
+    assert build_service_42_frame(address) == frame
+
+
+def test_corrupted_info_is_rejected():
+    corrupted = SAMPLE_RAW.replace(b"0CF4", b"0CF5", 1)
+    with pytest.raises(FrameChecksumError) as info:
+        BMSParser.parse_frame(corrupted)
+    assert info.value.kind == "frame"
+    assert info.value.received == 0xD3EF
+
+
+def test_corrupted_length_nibble_is_rejected():
+    corrupted = SAMPLE_RAW.replace(b"E0C6", b"F0C6", 1)
+    with pytest.raises(FrameChecksumError) as info:
+        BMSParser.parse_frame(corrupted)
+    assert info.value.kind == "length"
+    assert (info.value.expected, info.value.received) == (0xE, 0xF)
+
+
+def test_validation_can_be_skipped():
+    corrupted = SAMPLE_RAW.replace(b"0CF4", b"0CF5", 1)
+    assert BMSParser.parse_frame(corrupted, validate=False).cell_voltages_v[0] == pytest.approx(3.317)
+
+
+def test_hex_parser_validates_too():
+    with pytest.raises(FrameChecksumError):
+        BMSParser.parse_service_42_response(SAMPLE_HEX.replace("0CF4", "0CF5", 1))
@@ -0,0 +1,163 @@
+"""Configuration reload: diff of two snapshots, options watcher and applying the diff"""
+
+import json
+import logging
+
+import pytest
+
+import addon_config
+import main
+import multi_battery
+from addon_config import BatteryConfig, ConfigDiff, OptionsWatcher, get_config, reload_config
+from energy_tracker import EnergyTracker
+from multi_battery import MultiBatteryManager
+
+
+BATTERIES = [
+    {"port": "/dev/ttyTEST0", "address": 1, "name": "A"},
+    {"port": "/dev/ttyTEST0", "address": 2, "name": "B"},
+    {"port": "/dev/ttyTEST1", "address": 1, "name": "C", "enabled": False},
+]
+
+
+@pytest.fixture
+def options(tmp_path, monkeypatch):
+    """Writes options.json for a fresh config snapshot"""
+    path = tmp_path / "options.json"
+    monkeypatch.setattr(addon_config, "OPTIONS_PATH", str(path))
+    monkeypatch.setattr(addon_config, "_config", None)
+
+    def write(batteries=BATTERIES, **settings):
+        path.write_text(json.dumps(dict(
+            multi_battery_mode=True, prefer_by_id=False, batteries=batteries, **settings
+        )))
+        return str(path)
+
+    write()
+    return write
+
+
+@pytest.fixture
+def manager(options, tmp_path, monkeypatch):
+    class TmpEnergyTracker(EnergyTracker):
+        def __init__(self, **kwargs):
+            super().__init__(str(tmp_path / "energy.json"), **kwargs)
+
+    monkeypatch.setattr(multi_battery, "EnergyTracker", TmpEnergyTracker)
+    manager = MultiBatteryManager(get_config().get_enabled_batteries())
+    yield manager
+    manager.close()
+
+
+def names(batteries):
+    return sorted(b.name for b in batteries)
+
+
+def test_snapshot_is_read_only(options):
+    config = get_config()
+    assert get_config() is config
+    with pytest.raises(AttributeError):
+        config.read_interval = 5
+    with pytest.raises(AttributeError):
+        config.batteries[0].timeout = 5.0
+
+
+def test_diff_by_name(options):
+    old = get_config()
+    options(batteries=[
+        {"port": "/dev/ttyTEST0", "address": 1, "name": "A"},           # unchanged
+        {"port": "/dev/ttyTEST0", "address": 3, "name": "B"},           # moved
+        {"port": "/dev/ttyTEST1", "address": 1, "name": "C"},           # enabled now
+        {"port": "/dev/ttyTEST1", "address": 2, "name": "D", "enabled": False},
+    ], read_interval=5)
+    new, diff = reload_config()
+    assert diff.config is new and get_config() is new
+    assert names(diff.added) == ["C"]
+    assert names(diff.removed) == []
+    assert names(diff.changed) == ["B"]
+    assert diff.settings == ["read_interval"]
+    assert bool(diff)
+    assert ConfigDiff(old, old).summary() == "no changes"
+
+
+def test_removed_and_timeout_change(options):
+    old = get_config()
+    options(batteries=[{"port": "/dev/ttyTEST0", "address": 1, "name": "A", "timeout": 0.5}])
+    diff = ConfigDiff(old, reload_config()[0])
+    assert names(diff.removed) == ["B"]
+    assert names(diff.changed) == ["A"]
+    assert not diff.added and not diff.settings
+
+
+def test_watcher_reloads_only_on_change(options):
+    watcher = OptionsWatcher(addon_config.OPTIONS_PATH)
+    get_config()
+    assert watcher.poll() is None
+    options(batteries=BATTERIES[:1])
+    diff = watcher.poll()
+    assert names(diff.removed) == ["B"]
+    assert watcher.poll() is None
+
+
+def test_apply_config_diff(manager, options):
+    get_config()
+    options(batteries=[
+        {"port": "/dev/ttyTEST0", "address": 1, "name": "A", "baudrate": 19200},
+        {"port": "/dev/ttyTEST1", "address": 5, "name": "E"},
+    ])
+    diff = reload_config()[1]
+    assert manager.apply_config_diff(diff) == ["B"]
+    assert [(b.name, b.port, b.address, b.baudrate) for b in manager.batteries] == [
+        ("A", "/dev/ttyTEST0", 1, 19200),
+        ("E", "/dev/ttyTEST1", 5, 9600),
+    ]
+    assert "B" not in manager.health and "E" in manager.health
+
+
+def test_added_battery_on_used_address_is_refused(manager, options):
+    get_config()
+    options(batteries=BATTERIES + [{"port": "/dev/ttyTEST0", "address": 2, "name": "Twin"}])
+    assert manager.apply_config_diff(reload_config()[1]) == []
+    assert names(manager.batteries) == ["A", "B"]
+
+
+class FakePublisher:
+    LIVE_SETTINGS = ("mqtt_json_state", "heartbeat_interval")
+
+    def __init__(self):
+        self.config = None
+        self.discovery = None
+        self.availability = None
+
+    def apply_config(self, config):
+        self.config = config
+
+    def request_discovery(self, battery_names):
+        self.discovery = battery_names
+
+    def publish_battery_availability(self, availability):
+        self.availability = availability
+        return True
+
+
+def test_live_settings_reach_publisher_and_others_need_restart(manager, options, caplog):
+    watcher = OptionsWatcher(addon_config.OPTIONS_PATH)
+    get_config()
+    options(batteries=BATTERIES[:1], mqtt_json_state=True, read_interval=5)
+    publisher = FakePublisher()
+    with caplog.at_level(logging.WARNING):
+        main.apply_config_changes(watcher, manager, publisher)
+    assert publisher.config is get_config()
+    assert publisher.config.mqtt_json_state is True
+    assert publisher.availability == {"B": False}
+    assert publisher.discovery == ["A"]
+    restart = [r.getMessage() for r in caplog.records if "Restart" in r.getMessage()]
+    assert len(restart) == 1 and "read_interval" in restart[0] and "mqtt_json_state" not in restart[0]
+
+
+def test_with_name_copy_is_read_only():
+    battery = BatteryConfig("/dev/ttyTEST0", 4, "Battery_4")
+    renamed = battery.with_name("Battery_4_2")
+    assert (renamed.name, renamed.port, renamed.address) == ("Battery_4_2", "/dev/ttyTEST0", 4)
+    with pytest.raises(AttributeError):
+        renamed.name = "x"
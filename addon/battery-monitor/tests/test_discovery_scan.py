@@ -0,0 +1,56 @@
+"""Discovery sweep of one port: early stop and baud rate fallback"""
+
+import pytest
+
+import discovery
+from discovery import _scan_port
+
+SERVICE_42 = [(9600, "service42")]
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    """Packs answering on a fake bus: address -> baud rate; probes are recorded"""
+    packs = {}
+    probes = []
+
+    def fingerprint(port, address, timeout_s, attempts):
+        probes.append((address, attempts[0][0]))
+        for baudrate, protocol in attempts:
+            if packs.get(address) == baudrate:
+                return {"address": address, "baudrate": baudrate, "protocol": protocol, "pack": {}}
+        return None
+
+    monkeypatch.setattr(discovery, "_fingerprint", fingerprint)
+    return packs, probes
+
+
+def addresses(scan):
+    return [device["address"] for device in scan["devices"]]
+
+
+def test_high_addresses_found_before_any_hit(bus):
+    packs, probes = bus
+    packs.update({10: 9600, 11: 9600, 12: 9600})
+    scan = _scan_port("/dev/x", 1, 16, 0.1, 8, SERVICE_42)
+    assert addresses(scan) == [10, 11, 12]
+    assert scan["probed"] == 16
+
+
+def test_stops_after_misses_past_last_hit(bus):
+    packs, probes = bus
+    packs.update({1: 9600, 2: 9600})
+    scan = _scan_port("/dev/x", 1, 32, 0.1, 4, SERVICE_42)
+    assert addresses(scan) == [1, 2]
+    assert scan["probed"] == 6
+
+
+def test_next_speed_only_when_nothing_answered(bus):
+    packs, probes = bus
+    packs.update({2: 19200, 3: 19200})
+    attempts = [(b, "service42") for b in (9600, 19200, 115200)]
+    scan = _scan_port("/dev/x", 1, 8, 0.1, 2, attempts)
+    assert addresses(scan) == [2, 3]
+    assert {baudrate for _, baudrate in probes} == {9600, 19200}
+    # 9600 swept the whole range, 19200 stopped two misses after address 3
+    assert scan["probed"] == 8 + 5
@@ -0,0 +1,71 @@
+"""EnergyTracker: trapezoidal integration, sign split and gap handling"""
+
+import time
+
+import pytest
+
+from energy_tracker import EnergyTracker
+
+
+@pytest.fixture
+def t0():
+    # Counters start with last_ts = now; samples must come after that
+    return time.time() + 1.0
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    return EnergyTracker(str(tmp_path / "counters.json"), flush_interval=3600, max_gap=7200)
+
+
+@pytest.mark.parametrize("p0, p1, dt, expected", [
+    (1000.0, 1000.0, 3600, (1.0, 0.0)),
+    (0.0, 2000.0, 3600, (1.0, 0.0)),        # ramp: average 1 kW
+    (-500.0, -1500.0, 3600, (0.0, 1.0)),
+    (1000.0, -1000.0, 3600, (0.25, 0.25)),  # zero crossing at half time
+    (3000.0, -1000.0, 3600, (1.125, 0.125)),
+    (0.0, 0.0, 3600, (0.0, 0.0)),
+])
+def test_trapezoid_kwh(p0, p1, dt, expected):
+    assert EnergyTracker._trapezoid_kwh(p0, p1, dt) == pytest.approx(expected)
+
+
+def test_first_sample_only_sets_the_baseline(tracker, t0):
+    assert tracker.update("a", 1000.0, now_ts=t0) == (0.0, 0.0)
+
+
+def test_counters_accumulate_in_and_out(tracker, t0):
+    tracker.update("a", 1000.0, now_ts=t0)
+    tracker.update("a", 1000.0, now_ts=t0 + 1800)
+    assert tracker.update("a", -1000.0, now_ts=t0 + 3600) == pytest.approx((0.625, 0.125))
+    assert tracker.update("a", -1000.0, now_ts=t0 + 5400) == pytest.approx((0.625, 0.625))
+
+
+def test_gap_longer_than_max_gap_is_discarded(tmp_path, t0):
+    tracker = EnergyTracker(str(tmp_path / "counters.json"), flush_interval=3600, max_gap=600)
+    tracker.update("a", 1000.0, now_ts=t0)
+    assert tracker.update("a", 1000.0, now_ts=t0 + 601) == (0.0, 0.0)
+    assert tracker.discarded_gaps == 1
+    # Integration resumes from the sample after the gap
+    assert tracker.update("a", 1000.0, now_ts=t0 + 601 + 360) == pytest.approx((0.1, 0.0))
+
+
+def test_non_numeric_power_leaves_counters_unchanged(tracker, t0):
+    tracker.update("a", 1000.0, now_ts=t0)
+    tracker.update("a", 1000.0, now_ts=t0 + 360)
+    assert tracker.update("a", None, now_ts=t0 + 720) == pytest.approx((0.1, 0.0))
+
+
+def test_update_many_integrates_devices_at_one_timestamp(tracker, t0):
+    tracker.update_many({"a": 1000.0, "b": -2000.0}, now_ts=t0)
+    totals = tracker.update_many({"a": 1000.0, "b": -2000.0}, now_ts=t0 + 360)
+    assert totals == {"a": pytest.approx((0.1, 0.0)), "b": pytest.approx((0.0, 0.2))}
+
+
+def test_monotonic_clock_drives_live_updates(tracker, monkeypatch):
+    mono = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: mono[0])
+    tracker.update("a", 3600.0)
+    mono[0] += 10
+    # 3.6 kW for 10 s = 0.01 kWh, whatever the wall clock did meanwhile
+    assert tracker.update("a", 3600.0) == pytest.approx((0.01, 0.0))
@@ -0,0 +1,90 @@
+"""Per-battery circuit breaker state machine"""
+
+import pytest
+
+from health import DEGRADED, HALF_OPEN, HEALTHY, OPEN, BatteryHealth
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def health(clock):
+    return BatteryHealth(open_after=3, base_backoff=10, max_backoff=40, clock=clock)
+
+
+def test_transitions_are_reported_once(health):
+    assert health.record_failure("timeout") == (HEALTHY, DEGRADED)
+    assert health.record_failure() is None
+    assert health.record_failure() == (DEGRADED, OPEN)
+    assert health.transitions == 2
+    assert health.last_error is None
+
+
+def test_degraded_is_still_polled_and_available(health):
+    health.record_failure("timeout")
+    assert health.state == DEGRADED
+    assert health.should_poll()
+    assert health.available
+    assert health.record_success() == (DEGRADED, HEALTHY)
+    assert health.consecutive_failures == 0
+
+
+def test_open_circuit_is_not_polled_until_probe_time(health, clock):
+    for _ in range(3):
+        health.record_failure()
+    assert health.state == OPEN
+    assert not health.available
+    assert health.next_probe == 10
+    clock.now = 9.9
+    assert not health.should_poll()
+    assert health.as_dict()['next_probe_in_s'] == pytest.approx(0.1)
+    clock.now = 10
+    assert health.should_poll()
+    assert health.state == HALF_OPEN
+
+
+def test_failed_probes_double_backoff_up_to_max(health, clock):
+    for _ in range(3):
+        health.record_failure()
+    for expected_backoff in (20, 40, 40):
+        clock.now = health.next_probe
+        assert health.should_poll() and health.state == HALF_OPEN
+        assert health.record_failure() == (HALF_OPEN, OPEN)
+        assert health.backoff == expected_backoff
+        assert health.next_probe == clock.now + expected_backoff
+
+
+def test_successful_probe_closes_circuit(health, clock):
+    for _ in range(3):
+        health.record_failure("no valid response")
+    clock.now = health.next_probe
+    health.should_poll()
+    assert health.record_success() == (HALF_OPEN, HEALTHY)
+    assert health.consecutive_failures == 0
+    assert health.backoff == 0
+    assert health.next_probe is None
+    assert health.as_dict() == {
+        'state': HEALTHY,
+        'available': True,
+        'consecutive_failures': 0,
+        'backoff_s': 0.0,
+        'next_probe_in_s': None,
+        'last_error': None,
+    }
+
+
+def test_open_after_is_at_least_one(clock):
+    health = BatteryHealth(open_after=0, clock=clock)
+    assert health.record_failure() == (HEALTHY, OPEN)
+    assert health.backoff == BatteryHealth.BASE_BACKOFF
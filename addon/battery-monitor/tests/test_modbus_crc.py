@@ -0,0 +1,46 @@
+"""Modbus CRC16: table-driven implementation against the bitwise reference"""
+
+import random
+
+import pytest
+
+from modbus import _compute_crc16_bitwise, build_modbus_request, check_crc16, compute_crc16
+
+
+@pytest.mark.parametrize("data, expected", [
+    (b"", 0xFFFF),
+    (b"123456789", 0x4B37),  # CRC-16/MODBUS check value
+    (bytes([0x01, 0x03, 0x00, 0x00, 0x00, 0x0A]), 0xCDC5),
+    (bytes([0x11, 0x03, 0x00, 0x6B, 0x00, 0x03]), 0x8776),
+])
+def test_crc16_vectors(data, expected):
+    assert compute_crc16(data) == expected
+    assert _compute_crc16_bitwise(data) == expected
+
+
+@pytest.mark.parametrize("length", list(range(0, 64)) + [255, 256, 1024])
+def test_table_matches_bitwise(length):
+    rng = random.Random(length)
+    data = bytes(rng.randrange(256) for _ in range(length))
+    expected = _compute_crc16_bitwise(data)
+    assert compute_crc16(data) == expected
+    assert compute_crc16(bytearray(data)) == expected
+    assert compute_crc16(memoryview(bytearray(data))) == expected
+
+
+@pytest.mark.parametrize("length", [1, 6, 64])
+def test_check_crc16_accepts_appended_crc(length):
+    data = bytes(range(length))
+    crc = compute_crc16(data)
+    frame = data + bytes([crc & 0xFF, crc >> 8])
+    assert check_crc16(frame)
+    assert not check_crc16(frame[:-1] + bytes([frame[-1] ^ 0x01]))
+
+
+def test_check_crc16_rejects_short_frames():
+    assert not check_crc16(b"")
+    assert not check_crc16(b"\xff\xff")
+
+
+def test_request_carries_crc_low_byte_first():
+    assert build_modbus_request(0x01, 0x03, 0x0000, 0x000A) == bytes.fromhex("01030000000AC5CD")
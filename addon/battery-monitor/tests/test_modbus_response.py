@@ -0,0 +1,37 @@
+"""Modbus RTU read responses: validation of normal and exception replies"""
+
+import struct
+
+import pytest
+
+from modbus import ModbusCRCError, ModbusError, ModbusExceptionResponse, compute_crc16, parse_modbus_response
+
+
+def frame(*data: int) -> bytes:
+    body = bytes(data)
+    return body + struct.pack("<H", compute_crc16(body))
+
+
+def test_returns_register_bytes():
+    assert parse_modbus_response(frame(0x01, 0x03, 0x02, 0x12, 0x34), 0x01, 0x03, 1) == b"\x12\x34"
+
+
+def test_normal_reply_from_other_slave_is_rejected():
+    with pytest.raises(ModbusError, match="slave 2"):
+        parse_modbus_response(frame(0x02, 0x03, 0x02, 0x12, 0x34), 0x01, 0x03, 1)
+
+
+def test_exception_reply():
+    with pytest.raises(ModbusExceptionResponse):
+        parse_modbus_response(frame(0x01, 0x83, 0x02), 0x01, 0x03, 1)
+
+
+def test_exception_reply_from_other_slave_is_not_ours():
+    with pytest.raises(ModbusError) as excinfo:
+        parse_modbus_response(frame(0x02, 0x83, 0x02), 0x01, 0x03, 1)
+    assert not isinstance(excinfo.value, ModbusExceptionResponse)
+
+
+def test_exception_reply_with_bad_crc():
+    with pytest.raises(ModbusCRCError):
+        parse_modbus_response(frame(0x01, 0x83, 0x02)[:-1] + b"\x00", 0x01, 0x03, 1)
@@ -0,0 +1,70 @@
+"""Publish-on-change: per-sensor deadbands and heartbeat"""
+
+import pytest
+
+from mqtt_helper import MultiBatteryMQTTPublisher
+
+
+SOC = {'data_key': 'soc_percent', 'deadband': 0.5}
+POWER = {'data_key': 'power_w', 'deadband': 5.0, 'deadband_pct': 2.0}
+STATUS = {'data_key': 'status'}
+
+
+@pytest.fixture
+def publisher():
+    # Only the deadband state; no MQTT client or config needed
+    publisher = MultiBatteryMQTTPublisher.__new__(MultiBatteryMQTTPublisher)
+    publisher.publish_on_change = True
+    publisher.heartbeat_interval = 300.0
+    publisher._last_published = {}
+    return publisher
+
+
+def test_first_value_is_always_sent(publisher):
+    assert publisher._should_publish('soc', SOC, 50.0, now=0)
+
+
+@pytest.mark.parametrize("value, sent", [(50.4, False), (49.6, False), (50.5, True), (49.5, True)])
+def test_absolute_deadband(publisher, value, sent):
+    publisher._last_published['soc'] = (50.0, 0)
+    assert publisher._should_publish('soc', SOC, value, now=10) is sent
+
+
+@pytest.mark.parametrize("last, value, sent", [
+    (100.0, 104.0, False),    # 5 W absolute deadband
+    (100.0, 105.0, True),
+    (1000.0, 1019.0, False),  # 2 % of 1000 W is larger than 5 W
+    (1000.0, 1020.0, True),
+])
+def test_relative_deadband_uses_larger_threshold(publisher, last, value, sent):
+    publisher._last_published['power'] = (last, 0)
+    assert publisher._should_publish('power', POWER, value, now=10) is sent
+
+
+def test_heartbeat_resends_unchanged_value(publisher):
+    publisher._last_published['soc'] = (50.0, 0)
+    assert not publisher._should_publish('soc', SOC, 50.0, now=299)
+    assert publisher._should_publish('soc', SOC, 50.0, now=300)
+
+
+def test_non_numeric_values_compare_for_equality(publisher):
+    publisher._last_published['status'] = ('idle', 0)
+    assert not publisher._should_publish('status', STATUS, 'idle', now=10)
+    assert publisher._should_publish('status', STATUS, 'charging', now=10)
+
+
+def test_bool_is_not_treated_as_number(publisher):
+    publisher._last_published['flag'] = (False, 0)
+    assert publisher._should_publish('flag', {'deadband': 5.0}, True, now=10)
+
+
+def test_sensor_without_deadband_sends_any_change(publisher):
+    publisher._last_published['count'] = (63, 0)
+    assert not publisher._should_publish('count', {}, 63, now=10)
+    assert publisher._should_publish('count', {}, 64, now=10)
+
+
+def test_disabled_sends_everything(publisher):
+    publisher.publish_on_change = False
+    publisher._last_published['soc'] = (50.0, 0)
+    assert publisher._should_publish('soc', SOC, 50.0, now=10)
@@ -0,0 +1,121 @@
+"""Publish queue: read order across spill/replay and retry of failed batteries"""
+
+import time
+
+import pytest
+
+from publish_queue import PublishQueue
+
+
+class FakePublisher:
+    """Records published samples; fail maps a battery to how many attempts fail"""
+
+    def __init__(self, connected: bool = True) -> None:
+        self.connected = connected
+        self.fail = {}
+        self.calls = []
+
+    def ensure_connected(self, timeout: float = 0) -> bool:
+        return self.connected
+
+    def publish_all_battery_data(self, all_data, reconnect_timeout=0, failed=None):
+        self.calls.append(dict(all_data))
+        for name in all_data:
+            if self.fail.get(name, 0) > 0:
+                self.fail[name] -= 1
+                failed.append(name)
+        return not failed
+
+    def published_values(self):
+        return [data["Battery_1"]["n"] for data in self.calls]
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def sample(n: int):
+    return {"Battery_1": {"n": n}}
+
+
+@pytest.fixture
+def spill_path(tmp_path):
+    return str(tmp_path / "spill.jsonl")
+
+
+def drain(publisher, spill_path, maxsize: int = 3) -> PublishQueue:
+    queue = PublishQueue(publisher, maxsize=maxsize, spill=True, spill_path=spill_path)
+    queue.start()
+    wait_for(lambda: queue.pending() == 0)
+    queue.stop()
+    return queue
+
+
+def test_offline_samples_come_back_in_read_order(spill_path):
+    offline = FakePublisher(connected=False)
+    queue = PublishQueue(offline, maxsize=3, spill=True, spill_path=spill_path)
+    for n in range(8):
+        queue.submit(sample(n), timestamp=n)
+    assert queue.stats["spilled"] == 5
+    queue.stop(timeout=0)
+
+    online = FakePublisher()
+    drain(online, spill_path)
+    assert online.published_values() == list(range(8))
+
+
+def test_overflow_while_replaying_keeps_order(spill_path):
+    offline = FakePublisher(connected=False)
+    first = PublishQueue(offline, maxsize=2, spill=True, spill_path=spill_path)
+    for n in range(4):
+        first.submit(sample(n), timestamp=n)
+    first.stop(timeout=0)
+
+    # Restart still offline: 0-3 are loaded for replay, 4-8 arrive and overflow to the file
+    second = PublishQueue(offline, maxsize=2, spill=True, spill_path=spill_path)
+    second.start()
+    for n in range(4, 9):
+        second.submit(sample(n), timestamp=n)
+    second.stop(timeout=0)
+
+    online = FakePublisher()
+    drain(online, spill_path)
+    assert online.published_values() == list(range(9))
+
+
+def test_only_failed_batteries_are_retried():
+    publisher = FakePublisher()
+    publisher.fail = {"Battery_2": 1}
+    queue = PublishQueue(publisher)
+    queue.RETRY_INTERVAL = 0.01
+    queue.start()
+    queue.submit({"Battery_1": {"n": 0}, "Battery_2": {"n": 0}})
+    wait_for(lambda: queue.pending() == 0)
+    queue.stop()
+    assert [sorted(call) for call in publisher.calls] == [["Battery_1", "Battery_2"], ["Battery_2"]]
+    assert queue.stats["retried"] == 1
+    assert queue.stats["published"] == 1
+
+
+def test_sample_retried_whole_when_everything_failed():
+    publisher = FakePublisher()
+    publisher.fail = {"Battery_1": 2}
+    queue = PublishQueue(publisher)
+    queue.RETRY_INTERVAL = 0.01
+    queue.start()
+    queue.submit(sample(0))
+    queue.submit(sample(1))
+    wait_for(lambda: queue.pending() == 0)
+    queue.stop()
+    assert publisher.published_values() == [0, 0, 0, 1]
+
+
+def test_snapshots_keep_only_published_fields():
+    publisher = FakePublisher(connected=False)
+    publisher.state_fields = lambda is_virtual: ["soc_percent"]
+    queue = PublishQueue(publisher)
+    queue.submit({"Battery_1": {"soc_percent": 50.0, "cell_voltages": [3.3] * 16}})
+    assert queue._queue[0][1] == {"Battery_1": {"soc_percent": 50.0}}
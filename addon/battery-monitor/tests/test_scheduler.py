@@ -0,0 +1,110 @@
+"""Fixed-rate scheduler: drift-free ticks, overruns and coalescing"""
+
+import asyncio
+import time
+
+import pytest
+
+from scheduler import FixedRateScheduler
+
+
+class FakeClock:
+    """Monotonic clock that only moves when slept on or advanced"""
+
+    def __init__(self, now: float = 100.0) -> None:
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, "sleep", clock.sleep)
+    return clock
+
+
+@pytest.fixture
+def scheduler(clock):
+    scheduler = FixedRateScheduler(10.0, clock=clock)
+    scheduler.start()
+    return scheduler
+
+
+def test_next_tick_is_none_before_start():
+    assert FixedRateScheduler(10.0).next_tick is None
+
+
+def test_ticks_stay_on_grid_whatever_the_cycle_took(scheduler, clock):
+    for work in (0.0, 3.0, 9.5, 1.25):
+        clock.now += work
+        assert scheduler.wait() == 0.0
+    assert clock.now == 140.0
+    assert clock.sleeps == [10.0, 7.0, 0.5, 8.75]
+    assert scheduler.next_tick == 140.0
+    assert scheduler.overruns == 0
+
+
+def test_overrun_fires_late_tick_at_once(scheduler, clock):
+    clock.now += 12.0
+    assert scheduler.wait() == pytest.approx(2.0)
+    assert clock.sleeps == [0.0]
+    assert scheduler.overruns == 1
+    assert scheduler.missed_ticks == 0
+    # Back on the grid for the next tick
+    scheduler.wait()
+    assert clock.now == 120.0
+
+
+def test_swallowed_ticks_are_coalesced(scheduler, clock):
+    clock.now += 35.0
+    assert scheduler.wait() == pytest.approx(5.0)
+    assert scheduler.missed_ticks == 2
+    assert scheduler.next_tick == 130.0
+    scheduler.wait()
+    assert clock.now == 140.0
+
+
+def test_advance_without_start_anchors_at_now(clock):
+    scheduler = FixedRateScheduler(5.0, clock=clock)
+    scheduler.wait()
+    assert clock.now == 105.0
+
+
+def test_stats(scheduler, clock):
+    scheduler.wait()
+    clock.now += 11.0
+    scheduler.wait()
+    assert scheduler.get_stats() == {
+        'cycles': 2,
+        'overruns': 1,
+        'missed_ticks': 0,
+        'last_lateness_s': 1.0,
+        'max_lateness_s': 1.0,
+    }
+
+
+def test_wait_async_uses_same_grid(scheduler, clock, monkeypatch):
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(seconds):
+        clock.sleep(seconds)
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+
+    async def run():
+        clock.now += 4.0
+        await scheduler.wait_async()
+        clock.now += 4.0
+        await scheduler.wait_async()
+
+    asyncio.run(run())
+    assert clock.now == 120.0
+    assert clock.sleeps == [6.0, 6.0]
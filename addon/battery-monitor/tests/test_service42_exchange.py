@@ -0,0 +1,100 @@
+"""Service 42 exchange on an open port: timeouts and timing"""
+
+import pytest
+
+import modbus
+from modbus import ExchangeTiming, _exchange_service_42, build_service_42_frame
+
+
+class FakeSerial:
+    """Port whose reads take a fixed time on a fake clock"""
+
+    def __init__(self, clock, reply: bytes, timeout: float, first_byte_delay: float = 0.1) -> None:
+        self.clock = clock
+        self.reply = reply
+        self._timeout = timeout
+        self.first_byte_delay = first_byte_delay
+        self.timeout_changes = []
+        self.written = b""
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value: float) -> None:
+        self.timeout_changes.append(value)
+        self._timeout = value
+
+    def reset_input_buffer(self) -> None:
+        pass
+
+    def reset_output_buffer(self) -> None:
+        pass
+
+    def write(self, data: bytes) -> None:
+        self.written += data
+
+    def flush(self) -> None:
+        pass
+
+    def read(self, size: int = 1) -> bytes:
+        if not self.reply or self.first_byte_delay > self._timeout:
+            self.clock.now += self._timeout
+            return b""
+        self.clock.now += self.first_byte_delay
+        head, self.reply = self.reply[:size], self.reply[size:]
+        return head
+
+    def read_until(self, expected: bytes = b"\n") -> bytes:
+        self.clock.now += 0.05
+        return self.reply
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(modbus.time, "monotonic", clock)
+    return clock
+
+
+REPLY = b"~22014A00\r"
+
+
+def test_plain_read_keeps_port_timeout(clock):
+    ser = FakeSerial(clock, REPLY, timeout=1.0)
+    assert _exchange_service_42(ser, build_service_42_frame(1), 1.0) == REPLY
+    assert ser.written == build_service_42_frame(1)
+    assert ser.timeout_changes == []
+
+
+def test_timing_shares_one_deadline(clock):
+    ser = FakeSerial(clock, REPLY, timeout=1.0, first_byte_delay=0.25)
+    timing = ExchangeTiming()
+    assert _exchange_service_42(ser, b"", 1.0, timing=timing) == REPLY
+    assert timing.first_byte == pytest.approx(0.25)
+    assert timing.total == pytest.approx(0.3)
+    # The rest of the reply gets what is left, not another full timeout
+    assert ser.timeout_changes == [pytest.approx(0.75)]
+
+
+def test_first_byte_timeout_gives_up_early(clock):
+    ser = FakeSerial(clock, REPLY, timeout=1.0, first_byte_delay=0.5)
+    timing = ExchangeTiming()
+    assert _exchange_service_42(ser, b"", 1.0, first_byte_timeout=0.2, timing=timing) == b""
+    assert clock.now == pytest.approx(0.2)
+    assert timing.first_byte is None and timing.total is None
+
+
+def test_first_byte_timeout_then_rest_of_deadline(clock):
+    ser = FakeSerial(clock, REPLY, timeout=1.0, first_byte_delay=0.1)
+    assert _exchange_service_42(ser, b"", 1.0, first_byte_timeout=0.2) == REPLY
+    assert ser.timeout_changes == [0.2, pytest.approx(0.9)]